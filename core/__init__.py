@@ -1,21 +1,90 @@
 import logging
-from typing_extensions import Optional, Union, List
+from typing_extensions import Optional, Union, List, Tuple
 from datetime import datetime, timedelta, timezone
 
-from discord import Embed
+from discord import Embed, Intents
+from discord.ext.commands import Context
 
-from models import RedisOrm
-from models.quote import Quotes
+import settings
+from core.dispatch import DISPATCHER
+from models import (SQL_LATENCY, SQL_POOL_WAIT, SQL_STATEMENTS, WRITE_BEHIND,
+                    RedisOrm, sql_engine)
+from models.indicator import Indicators
+from models.quote import QUOTE_CACHE, Quotes
 from models.lunch_place import LunchPlace
+from models.news import News
 
 LOGGER = logging.getLogger(__name__)
 
+# Limites do Discord por mensagem.
+EMBEDS_PER_MESSAGE = 10
+EMBED_CHARS_PER_MESSAGE = 6000
+EMBED_FIELDS = 25
+# Tamanho máximo de cada linha nas listagens paginadas.
+PAGE_LINE_CHARS = 150
+
 
 async def migrate() -> None:
     await Quotes.migrate()
     await LunchPlace.migrate()
 
 
+async def backfill() -> None:
+    try:
+        total = await Indicators.backfill()
+        LOGGER.info('%s rankings backfilled.', total)
+    finally:
+        await RedisOrm.disconnect()
+
+
+def format_stats() -> str:
+    """
+    Resumo das métricas de banco, pools, caches e filas para o `--stats`.
+    """
+    lines = ['SQL (count | avg ms | p95 ms)']
+
+    for labels, summary in sorted(SQL_LATENCY.summary().items()):
+        lines.append(
+            f'  {dict(labels).get("statement")}: {summary["count"]} | '
+            f'{summary["avg"] * 1000:.1f} | {summary["p95"] * 1000:.0f}'
+        )
+
+    for summary in SQL_POOL_WAIT.summary().values():
+        lines.append(
+            f'Pool wait: {summary["count"]} | '
+            f'{summary["avg"] * 1000:.1f} | {summary["p95"] * 1000:.0f}'
+        )
+
+    lines.append(f'Pool: {sql_engine.pool.status()}')
+    lines.append(f'Distinct statements: {len(SQL_STATEMENTS)}')
+    lines.append(f'Redis pool: {RedisOrm.stats()}')
+    lines.append(f'Quote cache: {QUOTE_CACHE.stats()}')
+    lines.append(f'Dispatch: {DISPATCHER.stats()}')
+    lines.append(f'Write-behind: {WRITE_BEHIND.stats()}')
+    return '```\n' + '\n'.join(lines) + '\n```'
+
+
+def get_intents(profile: str) -> Intents:
+    """
+    Intents do gateway para o perfil configurado.
+    `minimal` pede só o que os comandos usam; `all` pede tudo.
+    """
+    if profile == 'all':
+        return Intents.all()
+
+    intents = Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.message_content = True
+    return intents
+
+
+def is_command(content: str) -> bool:
+    """
+    Verificação barata se a mensagem pode ser um comando do bot.
+    """
+    return content.startswith(settings.COMMAND_PREFIX)
+
 
 def naive_dt_utc_br(dt: datetime) -> str:
     """
@@ -96,6 +165,78 @@ def prettify_quote(quote: Quotes) -> Embed:
     return embed
 
 
+def format_page(rows: List[Tuple[int, str]], next_page: Optional[str] = None) -> str:
+    """
+    Monta uma página de listagem `ID: texto`, com o comando da próxima página.
+    """
+    lines = []
+
+    for id, text in rows:
+        text = str(text).replace('\n', ' ')
+        text = text if len(text) <= PAGE_LINE_CHARS else f'{text[:PAGE_LINE_CHARS - 1]}…'
+        lines.append(f'**{id}**: {text}')
+
+    if next_page:
+        lines.append(f'> Próxima página: `{next_page}`')
+
+    return '\n'.join(lines)
+
+
+def prettify_news(new: News) -> Embed:
+    """
+    Embeleza a notícia.
+    """
+    embed = Embed(type='rich')
+    embed.add_field(
+        name='Título',
+        value=new.new,
+        inline=False
+    )
+    embed.add_field(
+        name='Publicado',
+        value=new.date,
+        inline=False,
+    )
+    embed.add_field(
+        name='Notícia completa',
+        value=new.link,
+        inline=False,
+    )
+    embed.set_image(url=new.image)
+    return embed
+
+
+def chunk_embeds(embeds: List[Embed]) -> List[List[Embed]]:
+    """
+    Agrupa os embeds no menor número de mensagens que o Discord aceita.
+    """
+    chunks = []
+    chunk = []
+    size = 0
+
+    for embed in embeds:
+        if chunk and (len(chunk) == EMBEDS_PER_MESSAGE or size + len(embed) > EMBED_CHARS_PER_MESSAGE):
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+
+        chunk.append(embed)
+        size += len(embed)
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+async def send_embeds(ctx: Context, embeds: List[Embed], content: str = '') -> None:
+    """
+    Envia vários embeds com o mínimo de mensagens. O texto vai na primeira.
+    """
+    for i, chunk in enumerate(chunk_embeds(embeds)):
+        await DISPATCHER.send(ctx, content if i == 0 else '', embeds=chunk)
+
+
 class Controll:
     """
     Crontrola comportamentos relativos ao gerenciamento de usabilidade do bot.
@@ -114,8 +255,11 @@ class Controll:
             if not isinstance(quoteid, int):
                 quoteid = str(quoteid)
 
-            async with RedisOrm() as client:
-                await client.set(self.server, quoteid)
+            if WRITE_BEHIND.running:
+                WRITE_BEHIND.set(self.server, quoteid)
+            else:
+                async with RedisOrm() as client:
+                    await client.set(self.server, quoteid)
         except Exception as e:
             LOGGER.debug(e)
             raise e
@@ -127,8 +271,11 @@ class Controll:
         Recupera o ID do últimoquote usado.
         """
         try:
-            async with RedisOrm() as client:
-                data = await client.get(self.server)
+            data = WRITE_BEHIND.pending(self.server)
+
+            if data is None:
+                async with RedisOrm() as client:
+                    data = await client.get(self.server)
 
             return int(data) if data else None
         except Exception as e:
@@ -0,0 +1,101 @@
+import logging
+import tracemalloc
+from time import process_time
+from typing_extensions import Dict, List
+
+from discord import ClientUser, Guild, Message, TextChannel
+from discord.ext.commands import Command, Context
+
+import settings
+from core.bot import client, on_message
+from core.shards import SHARDS
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Comando sem efeito usado pelas mensagens de comando do benchmark.
+NOOP_COMMAND = 'bench_noop'
+
+GUILD_ID = 1
+CHANNEL_ID = 2
+AUTHOR: Dict = {'id': 3, 'username': 'membro', 'discriminator': '0', 'avatar': None}
+
+
+async def _noop(ctx: Context) -> None:
+    pass
+
+
+def _messages(total: int, ratio: float) -> List[Message]:
+    """
+    Mensagens sintéticas de um canal de servidor, `ratio` delas sendo comandos.
+    """
+    state = client._connection
+    state.user = ClientUser(state=state, data={
+        'id': 4, 'username': 'luna', 'discriminator': '0', 'avatar': None, 'bot': True,
+    })
+    guild = Guild(data={'id': GUILD_ID}, state=state)
+    channel = TextChannel(state=state, guild=guild, data={
+        'id': CHANNEL_ID, 'type': 0, 'name': 'geral', 'position': 0, 'guild_id': GUILD_ID,
+    })
+
+    return [
+        Message(state=state, channel=channel, data={
+            'id': i,
+            'channel_id': CHANNEL_ID,
+            'author': AUTHOR,
+            'content': f'{settings.COMMAND_PREFIX}{NOOP_COMMAND}' if i < total * ratio
+                else f'mensagem qualquer número {i} no canal',
+            'attachments': [],
+            'embeds': [],
+            'mentions': [],
+            'mention_roles': [],
+            'mention_everyone': False,
+            'pinned': False,
+            'tts': False,
+            'type': 0,
+            'timestamp': '2024-01-01T00:00:00+00:00',
+            'edited_timestamp': None,
+        })
+        for i in range(total)
+    ]
+
+
+async def _without_filter(message: Message) -> None:
+    # O `on_message` do bot sem o pré-filtro.
+    if not message.guild:
+        return
+
+    SHARDS.hit(message.guild.shard_id)
+    await client.process_commands(message)
+
+
+async def bench_on_message(total: int = 10000, ratio: float = 0.05) -> None:
+    """
+    Compara CPU e memória de `total` mensagens, com `ratio` delas sendo
+    comandos, passando pelo `on_message` do bot com e sem o pré-filtro.
+    """
+    messages = _messages(total, ratio)
+    client.add_command(Command(_noop, name=NOOP_COMMAND))
+    # O log de cada evento despachado pesaria mais que o próprio processamento.
+    discord_logger = logging.getLogger('discord')
+    level = discord_logger.level
+    discord_logger.setLevel(logging.WARNING)
+
+    async def measure(name: str, handler) -> None:
+        tracemalloc.start()
+        start = process_time()
+
+        for message in messages:
+            await handler(message)
+
+        elapsed = process_time() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        LOGGER.info('%s: %.2fms CPU, %.1fKiB peak for %s messages.', name, elapsed * 1000, peak / 1024, total)
+
+    try:
+        await measure('Without pre-filter', _without_filter)
+        await measure('With pre-filter', on_message)
+    finally:
+        discord_logger.setLevel(level)
+        client.remove_command(NOOP_COMMAND)
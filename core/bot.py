@@ -1,14 +1,25 @@
 import logging
+from math import isfinite
 from random import choice
+from time import perf_counter
 from datetime import datetime
 from typing import Dict, List
 
-from discord import Embed, Intents, Message
-from discord.ext.commands import Context, Bot
-
-from core import (Controll, naive_dt_utc_br, get_command_args,
-                  get_command_message, prettify_quote)
-from models import Cache
+from discord import Embed, MemberCacheFlags, Message
+from discord.ext import tasks
+from discord.ext.commands import Context, AutoShardedBot
+
+import settings
+from metrics import Counter, Gauge, Histogram
+from core import (EMBED_FIELDS, Controll, naive_dt_utc_br, format_page, format_stats, get_command_args,
+                  get_command_message, get_intents, is_command,
+                  prettify_news, prettify_quote, send_embeds)
+from core.dispatch import DISPATCHER
+from core.exporter import METRICS_SERVER
+from core.shards import SHARDS
+from core.tracing import command_trace, setup_tracing, shutdown_tracing
+from models import WRITE_BEHIND, RedisOrm
+from models.http import HttpClient
 from models.quote import Quotes
 from models.indicator import Indicators
 from models.lunch_place import LunchPlace
@@ -23,7 +34,102 @@ INVALID_ARGS = '**Ooops.**\n> Valor inválido!'
 NOT_AUTHORIZED = '**Ooops.**\n> Você não tem autorização para fazer isso!'
 
 
-client = Bot(command_prefix='--', intents=Intents.all())
+class LunaBot(AutoShardedBot):
+    """
+    Bot com o ciclo de vida dos recursos compartilhados do processo.
+    """
+    async def setup_hook(self) -> None:
+        setup_tracing()
+        await RedisOrm.connect()
+        await HttpClient.connect()
+        WRITE_BEHIND.start()
+        refresh_news.start()
+        report_shards.start()
+
+        if settings.METRICS_PORT:
+            await METRICS_SERVER.start()
+
+    async def invoke(self, ctx: Context) -> None:
+        # Todo comando, inclusive o `help`, passa por aqui.
+        with command_trace(ctx):
+            await super().invoke(ctx)
+
+    async def close(self) -> None:
+        try:
+            refresh_news.cancel()
+            report_shards.cancel()
+            await DISPATCHER.close(settings.DISPATCH_DRAIN_TIMEOUT)
+            await super().close()
+        finally:
+            await METRICS_SERVER.stop()
+            await HttpClient.disconnect()
+            await WRITE_BEHIND.close()
+            await RedisOrm.disconnect()
+            shutdown_tracing()
+
+
+client = LunaBot(
+    command_prefix=settings.COMMAND_PREFIX,
+    intents=get_intents(settings.INTENTS),
+    member_cache_flags=MemberCacheFlags.none() if settings.INTENTS == 'minimal' else MemberCacheFlags.all(),
+    chunk_guilds_at_startup=settings.INTENTS != 'minimal',
+    max_messages=settings.MESSAGE_CACHE_SIZE or None,
+)
+
+
+COMMANDS = Counter('lunabot_commands_total', 'Command invocations.')
+COMMAND_LATENCY = Histogram('lunabot_command_seconds', 'Command latency.')
+Gauge('lunabot_gateway_latency_seconds', 'Gateway heartbeat latency per shard.', lambda: {
+    (('shard', shard_id),): latency
+    for shard_id, latency in client.latencies
+    if isfinite(latency)
+})
+Gauge('lunabot_shard_messages_total', 'Guild messages received per shard.', lambda: {
+    (('shard', shard_id),): total
+    for shard_id, total in SHARDS.messages.items()
+})
+
+
+@client.before_invoke
+async def start_command_timer(ctx: Context) -> None:
+    ctx.started_at = perf_counter()
+
+
+@client.after_invoke
+async def record_command(ctx: Context) -> None:
+    status = 'error' if ctx.command_failed else 'ok'
+    COMMANDS.inc(command=ctx.command.name, status=status)
+    started_at = getattr(ctx, 'started_at', None)
+
+    if started_at is not None:
+        COMMAND_LATENCY.observe(perf_counter() - started_at, command=ctx.command.name)
+
+
+@tasks.loop(seconds=settings.NEWS_REFRESH_INTERVAL)
+async def refresh_news() -> None:
+    """
+    Mantém o cache de notícias atualizado para o `--news` responder na hora.
+    """
+    await News.refresh_all()
+
+
+@tasks.loop(seconds=settings.SHARD_REPORT_INTERVAL)
+async def report_shards() -> None:
+    """
+    Registra a latência e a taxa de mensagens de cada shard.
+    """
+    SHARDS.sample()
+
+    for shard_id, stats in SHARDS.stats(client).items():
+        LOGGER.info(
+            'Shard %s: latency %.0fms, %s guilds, %.2f msg/s',
+            shard_id, stats['latency'] * 1000, stats['guilds'], stats['rate'],
+        )
+
+
+@report_shards.before_loop
+async def before_report_shards() -> None:
+    await client.wait_until_ready()
 
 
 @client.event
@@ -32,6 +138,12 @@ async def on_message(message: Message) -> None:
         if not message.guild:
             return
 
+        SHARDS.hit(message.guild.shard_id)
+
+        # Só mensagens com o prefixo passam pela maquinaria de comandos.
+        if not is_command(message.content):
+            return
+
         await client.process_commands(message)
     except Exception as e:
         LOGGER.error(e)
@@ -46,10 +158,10 @@ async def quote(ctx: Context) -> None:
     message = get_command_message(ctx.message.content)
 
     if not message:
-        await ctx.send(ARG_FAULT)
+        await DISPATCHER.send(ctx, ARG_FAULT)
         return
     elif not isinstance(message, str):
-        await ctx.send(INVALID_ARGS)
+        await DISPATCHER.send(ctx, INVALID_ARGS)
         return
 
     try:
@@ -62,17 +174,13 @@ async def quote(ctx: Context) -> None:
         await model.create()
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
         return
     else:
         indicator = Indicators(server)
         await indicator.q_usage(ctx.author.name)
 
-    try:
-        await ctx.send(embed=prettify_quote(model))
-    except Exception as e:
-        LOGGER.exception(e)
-        await ctx.send(ERROR_MESSAGE)
+    await DISPATCHER.send(ctx, embed=prettify_quote(model))
 
 
 @client.command(aliases=['rq'])
@@ -83,27 +191,17 @@ async def random_quote(ctx: Context) -> None:
     try:
         server = ctx.guild.id
         model = Quotes()
-        cache = Cache(server)
-        not_in = await cache.get()
-        ids = await model.get_ids_by_server(server, not_in)
+        quote = await model.draw(server)
 
-        if not ids:
-            await ctx.send(WITHOUT_INFO)
+        if not quote:
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
             return
 
-        id = choice(ids)
-        quote = await model.get(id, server)
-        await ctx.send(f'{quote.message}')
-        not_in.append(id)
-
-        # Se a lista for maior que 50% ele remove o primeiro item.
-        if (len(not_in) * 100) / len(ids) >= 50:
-            not_in.pop(0)
-
-        await cache.insert(not_in)
+        id = quote.id
+        await DISPATCHER.send(ctx, f'{quote.message}')
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
     else:
         indicator = Indicators(server)
         controll = Controll(server)
@@ -120,32 +218,36 @@ async def indicator_quote(ctx: Context, quantity: int=5) -> None:
     server = ctx.guild.id
     indicator = Indicators(server=server)
 
+    # O embed aceita até EMBED_FIELDS campos, um por usuário.
+    quantity = max(1, min(quantity, EMBED_FIELDS))
+
     try:
-        quoters = await indicator.q_get()
+        quoters = await indicator.q_top(quantity)
 
         if not quoters:
-            await ctx.send(WITHOUT_INFO)
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
             return
 
+        rank = await indicator.q_rank(ctx.author.name)
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
         return
 
-    try:
-        quoters_k = sorted(quoters, key=quoters.get, reverse=True) if quoters else []
-        _quoters = Embed(type='rich')
+    _quoters = Embed(type='rich')
 
-        for key in quoters_k[:quantity]:
-            _quoters.add_field(
-                name=key,
-                value=quoters[key],
-            )
+    for key, value in quoters:
+        _quoters.add_field(
+            name=key,
+            value=value,
+        )
 
-        await ctx.send(f'**Top {quantity} criadores:**', embed=_quoters)
-    except Exception as e:
-        LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+    message = f'**Top {quantity} criadores:**'
+
+    if rank:
+        message += f'\n> Você é o #{rank}'
+
+    await DISPATCHER.send(ctx, message, embed=_quoters)
 
 
 @client.command(aliases=['irq'])
@@ -157,33 +259,36 @@ async def indicator_random_quote(ctx: Context, quantity: int=5) -> None:
     server = ctx.guild.id
     indicator = Indicators(server=server)
 
+    # O embed aceita até EMBED_FIELDS campos, um por usuário.
+    quantity = max(1, min(quantity, EMBED_FIELDS))
+
     try:
-        requesters = await indicator.rq_get()
+        requesters = await indicator.rq_top(quantity)
 
         if not requesters:
-            await ctx.send(WITHOUT_INFO)
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
             return
 
+        rank = await indicator.rq_rank(ctx.author.name)
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
         return
 
-    try:
-        requesters_k = sorted(requesters, key=requesters.get, reverse=True)
-        _requesters = Embed(type='rich')
+    _requesters = Embed(type='rich')
 
-        for key in requesters_k[:quantity]:
-            _requesters.add_field(
-                name=key,
-                value=requesters[key],
-            )
+    for key, value in requesters:
+        _requesters.add_field(
+            name=key,
+            value=value,
+        )
 
-        await ctx.send(f'**Top {quantity} requesters:**', embed=_requesters)
+    message = f'**Top {quantity} requesters:**'
 
-    except Exception as e:
-        LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+    if rank:
+        message += f'\n> Você é o #{rank}'
+
+    await DISPATCHER.send(ctx, message, embed=_requesters)
 
 
 @client.command(aliases=['qid'])
@@ -199,13 +304,13 @@ async def quote_by_id(ctx: Context) -> None:
         quote = await model.get(id, server)
 
         if not quote:
-            await ctx.send(WITHOUT_INFO)
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
             return
 
-        await ctx.send(f'{quote.message}\n> By: {quote.created_by}')
+        await DISPATCHER.send(ctx, f'{quote.message}\n> By: {quote.created_by}')
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(INVALID_ARGS)
+        await DISPATCHER.send(ctx, INVALID_ARGS)
         return
     else:
         indicator = Indicators(server)
@@ -227,20 +332,83 @@ async def delete_quote_by_id(ctx: Context) -> None:
         quote = await model.get(id, server)
 
         if not quote:
-            await ctx.send(WITHOUT_INFO)
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
             return
         elif ctx.author.name != quote.created_by:
-            await ctx.send(NOT_AUTHORIZED)
+            await DISPATCHER.send(ctx, NOT_AUTHORIZED)
             return
 
         await quote.delete()
-        await ctx.send(f'A mensagen de ID {id} foi removida!')
+        await DISPATCHER.send(ctx, f'A mensagen de ID {id} foi removida!')
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(INVALID_ARGS)
+        await DISPATCHER.send(ctx, INVALID_ARGS)
         return
 
 
+@client.command(aliases=['ql'])
+async def quote_list(ctx: Context, after: int=None) -> None:
+    """
+    Lista os quotes do servidor, uma página por vez.
+    after: <int> :Listar a partir deste ID.
+    """
+    server = ctx.guild.id
+
+    try:
+        quotes = await Quotes().page(server, after)
+
+        if not quotes:
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
+            return
+
+        next_page = f'{settings.COMMAND_PREFIX}ql {quotes[-1].id}' \
+            if len(quotes) == settings.PAGE_SIZE else None
+        await DISPATCHER.send(ctx, format_page(
+            [(quote.id, quote.message) for quote in quotes],
+            next_page,
+        ))
+    except Exception as e:
+        LOGGER.error(e)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
+
+
+@client.command(aliases=['qs'])
+async def quote_search(ctx: Context) -> None:
+    """
+    Busca quotes do servidor por palavras, dos mais relevantes aos menos.
+    Para as próximas páginas, termine a busca com `#<página>`.
+    """
+    server = ctx.guild.id
+    terms = get_command_message(ctx.message.content)
+
+    if not terms:
+        await DISPATCHER.send(ctx, ARG_FAULT)
+        return
+
+    page = 1
+    words = terms.rsplit(' ', 1)
+
+    if len(words) == 2 and words[1].startswith('#') and words[1][1:].isdigit():
+        terms, page = words[0], max(int(words[1][1:]), 1)
+
+    try:
+        quotes = await Quotes().search(server, terms, page)
+
+        if not quotes:
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
+            return
+
+        next_page = f'{settings.COMMAND_PREFIX}qs {terms} #{page + 1}' \
+            if len(quotes) == settings.PAGE_SIZE else None
+        await DISPATCHER.send(ctx, format_page(
+            [(quote.id, quote.message) for quote in quotes],
+            next_page,
+        ))
+    except Exception as e:
+        LOGGER.error(e)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
+
+
 @client.command(aliases=['l'])
 async def lunch_place(ctx: Context) -> None:
     """
@@ -250,7 +418,7 @@ async def lunch_place(ctx: Context) -> None:
     place = get_command_message(ctx.message.content)
 
     if not place:
-        await ctx.send(ARG_FAULT)
+        await DISPATCHER.send(ctx, ARG_FAULT)
         return
 
     try:
@@ -263,34 +431,30 @@ async def lunch_place(ctx: Context) -> None:
         await model.create()
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
         return
 
-    try:
-        embed = Embed(type='rich')
-        embed.add_field(
-            name='ID',
-            value=model.id,
-        )
-        embed.add_field(
-            name='Usuário',
-            value=model.created_by,
-            inline=False,
-        )
-        embed.add_field(
-            name='Data',
-            value=naive_dt_utc_br(model.created_at),
-            inline=False,
-        )
-        embed.add_field(
-            name='Local',
-            value=model.place,
-            inline=False,
-        )
-        await ctx.send(embed=embed)
-    except Exception as e:
-        LOGGER.exception(e)
-        await ctx.send(ERROR_MESSAGE)
+    embed = Embed(type='rich')
+    embed.add_field(
+        name='ID',
+        value=model.id,
+    )
+    embed.add_field(
+        name='Usuário',
+        value=model.created_by,
+        inline=False,
+    )
+    embed.add_field(
+        name='Data',
+        value=naive_dt_utc_br(model.created_at),
+        inline=False,
+    )
+    embed.add_field(
+        name='Local',
+        value=model.place,
+        inline=False,
+    )
+    await DISPATCHER.send(ctx, embed=embed)
 
 
 @client.command(aliases=['rl', 'onde_vamos_almoçar'])
@@ -301,17 +465,42 @@ async def random_lunch_place(ctx: Context) -> None:
     try:
         server = ctx.guild.id
         model = LunchPlace()
-        ids = await model.get_ids_by_server(server)
-        _id = choice(ids)
-        place = await model.get(_id)
+        place = await model.pick(server)
 
         if not place:
-            await ctx.send(WITHOUT_INFO)
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
+            return
 
-        await ctx.send(f'> {model.get_random_intro()} {place.place}!')
+        await DISPATCHER.send(ctx, f'> {model.get_random_intro()} {place.place}!')
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
+
+
+@client.command(aliases=['ll'])
+async def lunch_place_list(ctx: Context, after: int=None) -> None:
+    """
+    Lista os locais de almoço do servidor, uma página por vez.
+    after: <int> :Listar a partir deste ID.
+    """
+    server = ctx.guild.id
+
+    try:
+        places = await LunchPlace().page(server, after)
+
+        if not places:
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
+            return
+
+        next_page = f'{settings.COMMAND_PREFIX}ll {places[-1].id}' \
+            if len(places) == settings.PAGE_SIZE else None
+        await DISPATCHER.send(ctx, format_page(
+            [(place.id, place.place) for place in places],
+            next_page,
+        ))
+    except Exception as e:
+        LOGGER.error(e)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
 
 
 @client.command(aliases=['lqi'])
@@ -328,45 +517,51 @@ async def last_quote_info(ctx: Context) -> None:
         quote = await model.get(id, server)
 
         if not quote:
-            await ctx.send(WITHOUT_INFO)
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
             return
 
-        await ctx.send('', embed=prettify_quote(quote))
+        await DISPATCHER.send(ctx, embed=prettify_quote(quote))
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
 
 
 @client.command(aliases=['n', 'nw', 'jornal'])
 async def news(ctx: Context) -> None:
     """
-    Captura as últimas 5 notícias em uma fonte selecionada. Opções: [bbc, cnn, tecmundo]
+    Captura as últimas notícias em uma fonte selecionada. Opções: [bbc, cnn, tecmundo, all]
     """
     try:
-        source = get_command_args(ctx.message.content) or choice(['bbc', 'cnn', 'tecmundo'])
-        _news = News(source=source.lower())
-        responses = await _news.get()
-
-        for response in responses[:5]:
-            embed = Embed(type='rich')
-            embed.add_field(
-                name='Título',
-                value=response.new,
-                inline=False
-            )
-            embed.add_field(
-                name='Publicado',
-                value=response.date,
-                inline=False,
-            )
-            embed.add_field(
-                name='Notícia completa',
-                value=response.link,
-                inline=False,
-            )
-            embed.set_image(url=response.image)
-            await ctx.send('', embed=embed)
+        source = get_command_args(ctx.message.content) or choice(News.SOURCES)
+        source = source.lower()
+
+        if source == 'all':
+            responses = await News.digest()
+        else:
+            responses = (await News(source=source).get())[:settings.NEWS_LIMIT]
 
+        if not responses:
+            await DISPATCHER.send(ctx, WITHOUT_INFO)
+            return
+
+        await send_embeds(ctx, [prettify_news(response) for response in responses])
+
+    except Exception as e:
+        LOGGER.error(e)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
+
+
+@client.command(aliases=['st'])
+async def stats(ctx: Context) -> None:
+    """
+    Métricas internas do bot. Só para administradores do servidor.
+    """
+    if not ctx.author.guild_permissions.administrator:
+        await DISPATCHER.send(ctx, NOT_AUTHORIZED)
+        return
+
+    try:
+        await DISPATCHER.send(ctx, format_stats())
     except Exception as e:
         LOGGER.error(e)
-        await ctx.send(ERROR_MESSAGE)
+        await DISPATCHER.send(ctx, ERROR_MESSAGE)
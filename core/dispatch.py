@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from collections import deque
+from time import monotonic
+from typing_extensions import Any, Deque, Dict, List, Optional
+
+from discord.ext.commands import Context
+
+import settings
+from metrics import stats_gauge
+from metrics.tracing import Span, detached, start_span
+from models.lru import LRUCache
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Limite de caracteres do Discord para o texto de uma mensagem.
+MESSAGE_CHARS = 2000
+
+
+class Outgoing:
+    """
+    Mensagem aguardando envio, com os trechos de trace que ela fecha ao sair.
+    """
+    __slots__ = ('ctx', 'content', 'kwargs', 'spans')
+
+    def __init__(self, ctx: Context, content: str, kwargs: Dict[str, Any], spans: List[Span]) -> None:
+        self.ctx = ctx
+        self.content = content
+        self.kwargs = kwargs
+        self.spans = spans
+
+    def finish(self, **attributes: Any) -> None:
+        for span in self.spans:
+            span.finish(**attributes)
+
+    @property
+    def mergeable(self) -> bool:
+        return not self.kwargs
+
+
+class Bucket:
+    """
+    Token bucket com o limite de mensagens por canal.
+    """
+    def __init__(self, rate: int, per: float) -> None:
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = monotonic()
+
+    async def acquire(self) -> None:
+        """
+        Espera até haver um token livre e o consome.
+        """
+        while True:
+            now = monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+
+class Dispatcher:
+    """
+    Fila de envio de mensagens por canal.
+
+    Os comandos só enfileiram a resposta; um worker por canal envia respeitando
+    o limite do Discord, junta textos seguidos numa mensagem só e descarta os
+    mais antigos quando a fila enche.
+    """
+    def __init__(self, rate: int, per: float, max_queue: int, max_buckets: int) -> None:
+        self.rate = rate
+        self.per = per
+        self.max_queue = max_queue
+        self.queues: Dict[int, Deque[Outgoing]] = {}
+        # Parado por `per` segundos, o bucket já está cheio de novo e pode ser
+        # descartado sem afrouxar o limite.
+        self.buckets = LRUCache(max_buckets, per)
+        self.workers: Dict[int, asyncio.Task] = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def send(self, ctx: Context, content: str = '', **kwargs: Any) -> None:
+        """
+        Enfileira uma mensagem para o canal do contexto.
+        """
+        channel = ctx.channel.id
+        queue = self.queues.setdefault(channel, deque())
+        # O trecho vai da fila até o envio, que acontece depois do comando retornar.
+        span = start_span('discord.send', channel=channel)
+        spans = [span] if span else []
+        tail = queue[-1] if queue else None
+
+        # Texto simples entra no último da fila se couber: uma rajada de
+        # respostas curtas ocupa uma posição só e não é descartada.
+        if not kwargs and tail is not None and tail.mergeable \
+                and len(tail.content) + len(content) + 1 <= MESSAGE_CHARS:
+            tail.content = f'{tail.content}\n{content}'
+            tail.spans.extend(spans)
+            self.coalesced += 1
+            return
+
+        if len(queue) >= self.max_queue:
+            queue.popleft().finish(dropped=True)
+            self.dropped += 1
+            LOGGER.warning('Dispatch queue full for channel %s, dropping oldest message.', channel)
+
+        queue.append(Outgoing(ctx, content, kwargs, spans))
+
+        if channel not in self.workers:
+            self.workers[channel] = asyncio.create_task(
+                self._work(channel), name=f'dispatch:{channel}', context=detached())
+
+    def _next(self, queue: Deque[Outgoing]) -> Outgoing:
+        """
+        Retira a próxima mensagem, juntando os textos simples que vierem logo atrás.
+        """
+        item = queue.popleft()
+
+        if not item.mergeable:
+            return item
+
+        content = item.content
+        spans = list(item.spans)
+
+        while queue and queue[0].mergeable \
+                and len(content) + len(queue[0].content) + 1 <= MESSAGE_CHARS:
+            merged = queue.popleft()
+            content = f'{content}\n{merged.content}'
+            spans.extend(merged.spans)
+            self.coalesced += 1
+
+        return Outgoing(item.ctx, content, item.kwargs, spans)
+
+    async def _work(self, channel: int) -> None:
+        queue = self.queues[channel]
+        bucket = self.buckets.get(channel) or Bucket(self.rate, self.per)
+
+        try:
+            while queue:
+                await bucket.acquire()
+                item = self._next(queue)
+
+                try:
+                    await item.ctx.send(item.content, **item.kwargs)
+                    self.sent += 1
+                    item.finish()
+                except asyncio.CancelledError:
+                    item.finish(error='cancelled')
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    item.finish(error=repr(e))
+                    LOGGER.error('Cannot send message to channel %s.\nCause: %s', channel, e)
+        finally:
+            del self.workers[channel]
+            self.buckets.set(channel, bucket)
+
+            if not queue:
+                self.queues.pop(channel, None)
+
+    def depth(self) -> int:
+        """
+        Total de mensagens aguardando envio.
+        """
+        return sum(len(queue) for queue in self.queues.values())
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Estatísticas da fila para monitoramento.
+        """
+        return {
+            'depth': self.depth(),
+            'channels': len(self.workers),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Espera as filas esvaziarem por até `timeout` segundos e cancela o resto.
+        """
+        workers = list(self.workers.values())
+
+        if not workers:
+            return
+
+        _, pending = await asyncio.wait(workers, timeout=timeout)
+
+        for task in pending:
+            task.cancel()
+
+        if pending:
+            LOGGER.warning('Dispatcher closed with %s messages pending.', self.depth())
+
+
+DISPATCHER = Dispatcher(
+    rate=settings.DISPATCH_RATE,
+    per=settings.DISPATCH_PER,
+    max_queue=settings.DISPATCH_MAX_QUEUE,
+    max_buckets=settings.DISPATCH_MAX_BUCKETS,
+)
+
+stats_gauge('lunabot_dispatch', 'Outbound message queue state.', DISPATCHER.stats)
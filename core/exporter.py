@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from time import perf_counter
+from typing_extensions import Optional
+
+from aiohttp import web
+
+import settings
+from metrics import Histogram, render
+
+
+LOGGER = logging.getLogger(__name__)
+
+LOOP_LAG = Histogram('lunabot_event_loop_lag_seconds', 'Event loop scheduling delay.')
+
+
+class MetricsServer:
+    """
+    Servidor HTTP do `/metrics` no formato do Prometheus, rodando no mesmo
+    event loop do bot.
+    """
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+        self._lag_task: Optional[asyncio.Task] = None
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=render().encode(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        )
+
+    async def _watch_loop_lag(self) -> None:
+        """
+        Mede o quanto cada `sleep` atrasa além do pedido; é o tempo que o loop
+        ficou ocupado com outras tarefas.
+        """
+        while True:
+            start = perf_counter()
+            await asyncio.sleep(settings.LOOP_LAG_INTERVAL)
+            LOOP_LAG.observe(max(perf_counter() - start - settings.LOOP_LAG_INTERVAL, 0))
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self._lag_task = asyncio.create_task(self._watch_loop_lag(), name='loop-lag')
+        LOGGER.info('Metrics available on http://%s:%s/metrics', self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+METRICS_SERVER = MetricsServer(settings.METRICS_HOST, settings.METRICS_PORT)
@@ -0,0 +1,57 @@
+import logging
+from collections import defaultdict
+from time import monotonic
+from typing_extensions import Dict
+
+from discord.ext.commands import AutoShardedBot
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ShardMonitor:
+    """
+    Acompanha a latência e a taxa de mensagens de cada shard do processo.
+    """
+    def __init__(self) -> None:
+        self.messages: Dict[int, int] = defaultdict(int)
+        self.rates: Dict[int, float] = {}
+        self._last: Dict[int, int] = {}
+        self._last_at = monotonic()
+
+    def hit(self, shard_id: int) -> None:
+        """
+        Conta uma mensagem recebida pelo shard.
+        """
+        self.messages[shard_id] += 1
+
+    def sample(self) -> None:
+        """
+        Recalcula as mensagens por segundo desde a última amostra.
+        """
+        now = monotonic()
+        elapsed = now - self._last_at or 1
+
+        for shard_id, total in self.messages.items():
+            self.rates[shard_id] = (total - self._last.get(shard_id, 0)) / elapsed
+            self._last[shard_id] = total
+
+        self._last_at = now
+
+    def stats(self, client: AutoShardedBot) -> Dict[int, Dict[str, float]]:
+        """
+        Estatísticas por shard para monitoramento.
+        """
+        return {
+            shard_id: {
+                'latency': shard.latency,
+                'closed': shard.is_closed(),
+                'guilds': sum(1 for g in client.guilds if g.shard_id == shard_id),
+                'messages': self.messages.get(shard_id, 0),
+                'rate': self.rates.get(shard_id, 0.0),
+            }
+            for shard_id, shard in client.shards.items()
+        }
+
+
+SHARDS = ShardMonitor()
@@ -0,0 +1,112 @@
+import logging
+from contextlib import contextmanager
+from random import random
+from typing_extensions import Any, Dict, Iterator, Optional
+
+from discord.ext.commands import Context
+
+import settings
+from metrics import tracing
+from metrics.tracing import Span, Trace
+
+
+LOGGER = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import trace as otel
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+except ImportError:
+    otel = None
+
+_tracer = None
+_provider = None
+
+
+@contextmanager
+def command_trace(ctx: Context) -> Iterator[Optional[Trace]]:
+    """
+    Registra a árvore de trechos (banco, Redis, envio ao Discord) da execução
+    do comando, para a fração `TRACE_SAMPLE_RATE` das execuções.
+    """
+    if ctx.command is None or random() >= settings.TRACE_SAMPLE_RATE:
+        yield None
+        return
+
+    trace = Trace(
+        f'command.{ctx.command.qualified_name}',
+        guild=ctx.guild.id if ctx.guild else None,
+        channel=ctx.channel.id,
+    )
+    token = tracing.activate(trace.root)
+
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.attributes['error'] = repr(e)
+        raise
+    finally:
+        tracing.deactivate(token)
+        trace.root.finish(failed=ctx.command_failed)
+
+
+def log_slow(trace: Trace) -> None:
+    """
+    Loga a árvore inteira dos comandos acima de `TRACE_SLOW_MS`.
+    """
+    if trace.duration * 1000 < settings.TRACE_SLOW_MS:
+        return
+
+    LOGGER.warning('Slow command (%.0fms):\n%s', trace.duration * 1000, '\n'.join(tracing.render(trace.root)))
+
+
+def _export_otel(trace: Trace) -> None:
+    def export(span: Span, parent: Optional[Any]) -> None:
+        context = otel.set_span_in_context(parent) if parent is not None else None
+        attributes: Dict[str, Any] = {
+            k: v if isinstance(v, (str, bool, int, float)) else str(v)
+            for k, v in span.attributes.items()
+            if v is not None
+        }
+        otel_span = _tracer.start_span(span.name, context=context, start_time=span.start, attributes=attributes)
+
+        for child in span.children:
+            export(child, otel_span)
+
+        otel_span.end(end_time=span.end)
+
+    export(trace.root, None)
+
+
+def setup_tracing() -> None:
+    """
+    Liga o log de comandos lentos e, com `OTEL_ENDPOINT` e o OpenTelemetry
+    instalado, a exportação OTLP para o coletor.
+    """
+    global _tracer, _provider
+
+    if log_slow not in tracing.EXPORTERS:
+        tracing.EXPORTERS.append(log_slow)
+
+    if not settings.OTEL_ENDPOINT:
+        return
+
+    if otel is None:
+        LOGGER.warning('OTEL_ENDPOINT is set but opentelemetry is not installed.')
+        return
+
+    _provider = TracerProvider(resource=Resource.create({'service.name': settings.OTEL_SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.OTEL_ENDPOINT)))
+    _tracer = _provider.get_tracer(__name__)
+    tracing.EXPORTERS.append(_export_otel)
+    LOGGER.info('Exporting traces to %s', settings.OTEL_ENDPOINT)
+
+
+def shutdown_tracing() -> None:
+    """
+    Envia os traces pendentes ao coletor.
+    """
+    if _provider is not None:
+        _provider.shutdown()
@@ -0,0 +1,160 @@
+import csv
+import json
+import logging
+from datetime import datetime
+from time import monotonic
+from typing_extensions import Dict, Iterator, Optional, Set, TextIO
+
+from sqlalchemy import Table, insert, select
+
+import settings
+from models import RedisOrm, sql_engine
+from models.deck import Deck
+from models.lunch_place import LunchPlace
+from models.quote import Quotes
+
+
+LOGGER = logging.getLogger(__name__)
+
+TABLES: Dict[str, Table] = {
+    'quotes': Quotes.__table__,
+    'lunch': LunchPlace.__table__,
+}
+
+
+def _guess_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+
+    return 'csv' if path.endswith('.csv') else 'ndjson'
+
+
+def _serialize(row: Dict) -> Dict:
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row.items()
+    }
+
+
+def _read(file: TextIO, fmt: str) -> Iterator[Dict]:
+    """
+    Lê o arquivo linha a linha, sem carregá-lo inteiro na memória.
+    """
+    if fmt == 'csv':
+        yield from csv.DictReader(file)
+        return
+
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+class Progress:
+    """
+    Registra o andamento e a vazão de uma importação ou exportação.
+    """
+    def __init__(self, action: str) -> None:
+        self.action = action
+        self.rows = 0
+        self.started = monotonic()
+
+    def add(self, rows: int) -> None:
+        self.rows += rows
+        elapsed = monotonic() - self.started
+        LOGGER.info('%s %s rows (%.0f rows/s).', self.action, self.rows, self.rows / elapsed if elapsed else 0)
+
+
+async def export_rows(model: str, path: str, fmt: Optional[str] = None,
+                      server: Optional[str] = None, batch: int = settings.TRANSFER_BATCH) -> int:
+    """
+    Exporta a tabela em NDJSON ou CSV com um cursor do lado do servidor,
+    lendo `batch` linhas por vez.
+    """
+    table = TABLES[model]
+    fmt = _guess_format(path, fmt)
+    progress = Progress('Exported')
+    stmt = select(table).order_by(table.c.id)
+
+    if server:
+        stmt = stmt.where(table.c.server == server)
+
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=table.c.keys()) if fmt == 'csv' else None
+
+        if writer:
+            writer.writeheader()
+
+        async with sql_engine.connect() as conn:
+            result = await conn.stream(stmt.execution_options(yield_per=batch))
+
+            async for rows in result.mappings().partitions(batch):
+                for row in rows:
+                    row = _serialize(dict(row))
+
+                    if writer:
+                        writer.writerow(row)
+                    else:
+                        file.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+                progress.add(len(rows))
+
+    return progress.rows
+
+
+async def import_rows(model: str, path: str, fmt: Optional[str] = None,
+                      server: Optional[str] = None, batch: int = settings.TRANSFER_BATCH) -> int:
+    """
+    Importa NDJSON ou CSV com inserts de várias linhas, `batch` por vez.
+    Os ids de origem são descartados; `server` substitui o servidor das linhas.
+    """
+    table = TABLES[model]
+    fmt = _guess_format(path, fmt)
+    columns = [c for c in table.c.keys() if c != 'id']
+    progress = Progress('Imported')
+    servers: Set[str] = set()
+    chunk = []
+
+    async def flush() -> None:
+        async with sql_engine.begin() as conn:
+            await conn.execute(insert(table), chunk)
+
+        progress.add(len(chunk))
+        chunk.clear()
+
+    with open(path, newline='', encoding='utf-8') as file:
+        for row in _read(file, fmt):
+            row = {column: row.get(column) for column in columns}
+            row['server'] = server or row['server']
+            row['created_at'] = datetime.fromisoformat(row['created_at']) \
+                if row.get('created_at') else datetime.now()
+            servers.add(str(row['server']))
+            chunk.append(row)
+
+            if len(chunk) >= batch:
+                await flush()
+
+    if chunk:
+        await flush()
+
+    # Os baralhos do --rq e os locais do --rl não conhecem as linhas importadas.
+    for _server in servers:
+        if model == 'quotes':
+            await Deck(_server).reset()
+        else:
+            await LunchPlace.invalidate(_server)
+
+    return progress.rows
+
+
+async def transfer(action: str, model: str, path: str, fmt: Optional[str] = None,
+                   server: Optional[str] = None) -> None:
+    try:
+        if action == 'import':
+            total = await import_rows(model, path, fmt, server)
+        else:
+            total = await export_rows(model, path, fmt, server)
+
+        LOGGER.info('%s finished: %s rows.', action.capitalize(), total)
+    finally:
+        await RedisOrm.disconnect()
+        await sql_engine.dispose()
@@ -3,7 +3,9 @@ import logging
 from argparse import ArgumentParser
 
 import settings
-from core import bot, migrate
+from core import backfill, bot, migrate
+from core.bench import bench_on_message
+from core.transfer import TABLES, transfer
 
 
 LOGGER = logging.getLogger(__name__)
@@ -13,7 +15,38 @@ parser.add_argument(
     'command',
     type=str,
     action='store',
-    help='Command to execute. [ migrate | bot ]',
+    help='Command to execute. [ migrate | backfill | bench | import | export | bot ]',
+)
+parser.add_argument(
+    '--model',
+    choices=list(TABLES),
+    default='quotes',
+    help='Table to import or export.',
+)
+parser.add_argument(
+    '--file',
+    help='NDJSON or CSV file to import from or export to.',
+)
+parser.add_argument(
+    '--format',
+    choices=['ndjson', 'csv'],
+    help='File format. Guessed from the file extension when omitted.',
+)
+parser.add_argument(
+    '--server',
+    help='Export only this server, or import every row into it.',
+)
+parser.add_argument(
+    '--shard-count',
+    type=int,
+    default=settings.SHARD_COUNT,
+    help='Total number of shards across all bot processes.',
+)
+parser.add_argument(
+    '--shard-ids',
+    type=lambda value: [int(i) for i in value.split(',')],
+    default=settings.SHARD_IDS,
+    help='Comma separated shard IDs owned by this process. Requires --shard-count.',
 )
 
 
@@ -26,7 +59,29 @@ if __name__ == '__main__':
                 asyncio.run(migrate())
             except Exception as e:
                 LOGGER.error(e)
+        case 'backfill':
+            try:
+                asyncio.run(backfill())
+            except Exception as e:
+                LOGGER.error(e)
+        case 'import' | 'export':
+            if not args.file:
+                parser.error(f'{args.command} requires --file')
+
+            try:
+                asyncio.run(transfer(args.command, args.model, args.file, args.format, args.server))
+            except Exception as e:
+                LOGGER.error(e)
+        case 'bench':
+            asyncio.run(bench_on_message())
         case 'bot':
+            if args.shard_ids and not args.shard_count:
+                parser.error('--shard-ids requires --shard-count')
+
+            # Definidos só aqui: no construtor, SHARD_IDS sem SHARD_COUNT
+            # derrubaria todos os comandos ao importar o bot.
+            bot.client.shard_count = args.shard_count
+            bot.client.shard_ids = args.shard_ids
             bot.client.run(settings.BOT_TOKEN)
         case _:
             pass
@@ -0,0 +1,177 @@
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from typing_extensions import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+
+    if not items:
+        return ''
+
+    escaped = [f'{k}="{v}"'.replace('\n', '\\n') for k, v in items]
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metric:
+    """
+    Métrica base, registrada no `REGISTRY` ao ser criada.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        REGISTRY.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}'] + self.samples()
+
+
+class Counter(Metric):
+    """
+    Contador que só cresce.
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self.values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        self.values[_labels(labels)] += amount
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_format(labels)} {value}' for labels, value in self.values.items()]
+
+
+class Gauge(Metric):
+    """
+    Valor instantâneo, lido de uma função na hora da coleta.
+    A função retorna um número ou `{((label, valor), ...): número}`.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, collect: Callable[[], object]) -> None:
+        super().__init__(name, help)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        try:
+            values = self.collect()
+        except Exception as e:
+            LOGGER.error('Cannot collect %s.\nCause: %s', self.name, e)
+            return []
+
+        if not isinstance(values, dict):
+            return [f'{self.name} {float(values)}']
+
+        return [f'{self.name}{_format(labels)} {float(value)}' for labels, value in values.items()]
+
+
+class Histogram(Metric):
+    """
+    Distribuição de valores (latências, em segundos) por faixas acumuladas.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = _labels(labels)
+        counts = self.counts.get(key)
+
+        if counts is None:
+            counts = self.counts[key] = [0] * (len(self.buckets) + 1)
+
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    def summary(self) -> Dict[Labels, Dict[str, float]]:
+        """
+        Total, média e p95 aproximado (limite da faixa) de cada conjunto de labels.
+        """
+        result = {}
+
+        for key, counts in self.counts.items():
+            total = sum(counts)
+            target = total * 0.95
+            cumulative = 0
+            p95 = float('inf')
+
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+
+                if cumulative >= target:
+                    p95 = bound
+                    break
+
+            result[key] = {
+                'count': total,
+                'avg': self.sums[key] / total if total else 0.0,
+                'p95': p95,
+            }
+
+        return result
+
+    def samples(self) -> List[str]:
+        lines = []
+
+        for key, counts in self.counts.items():
+            cumulative = 0
+
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format(key, ("le", str(bound)))} {cumulative}')
+
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{_format(key, ("le", "+Inf"))} {cumulative}')
+            lines.append(f'{self.name}_sum{_format(key)} {self.sums[key]}')
+            lines.append(f'{self.name}_count{_format(key)} {cumulative}')
+
+        return lines
+
+
+def stats_gauge(name: str, help: str, stats: Callable[[], Dict[str, float]]) -> Gauge:
+    """
+    Gauge a partir de uma função `stats()`, com um label `stat` por chave.
+    """
+    return Gauge(name, help, lambda: {
+        (('stat', key),): value
+        for key, value in stats().items()
+        if isinstance(value, (int, float))
+    })
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    """
+    Todas as métricas no formato texto do Prometheus.
+    """
+    lines = []
+
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+
+    return '\n'.join(lines) + '\n'
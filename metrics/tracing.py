@@ -0,0 +1,149 @@
+import logging
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, Token, copy_context
+from time import time_ns
+from typing_extensions import Any, Callable, Dict, Iterator, List, Optional
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    Trecho cronometrado de uma execução, com seus sub-trechos.
+    """
+    __slots__ = ('trace', 'name', 'attributes', 'start', 'end', 'children')
+
+    def __init__(self, trace: 'Trace', name: str, attributes: Dict[str, Any]) -> None:
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.start = time_ns()
+        self.end: Optional[int] = None
+        self.children: List[Span] = []
+
+    @property
+    def duration(self) -> float:
+        """
+        Duração em segundos (até agora, se ainda estiver aberto).
+        """
+        return ((self.end or time_ns()) - self.start) / 1e9
+
+    def finish(self, **attributes: Any) -> None:
+        if self.end is not None:
+            return
+
+        self.attributes.update(attributes)
+        self.end = time_ns()
+        self.trace._closed()
+
+
+class Trace:
+    """
+    Árvore de trechos de uma execução. Só termina quando todos os trechos
+    fecharem, inclusive os que terminam depois da raiz (como envios na fila).
+    """
+    def __init__(self, name: str, **attributes: Any) -> None:
+        self.open = 1
+        self.root = Span(self, name, attributes)
+
+    @property
+    def duration(self) -> float:
+        """
+        Do início da raiz ao fim do último trecho, em segundos.
+        """
+        def last(span: Span) -> int:
+            return max([span.end or span.start] + [last(child) for child in span.children])
+
+        return (last(self.root) - self.root.start) / 1e9
+
+    def _closed(self) -> None:
+        self.open -= 1
+
+        if self.open == 0:
+            for exporter in EXPORTERS:
+                try:
+                    exporter(self)
+                except Exception as e:
+                    LOGGER.error('Cannot export trace %s.\nCause: %s', self.root.name, e)
+
+
+# Funções chamadas com cada trace concluído.
+EXPORTERS: List[Callable[[Trace], None]] = []
+
+_CURRENT: ContextVar[Optional[Span]] = ContextVar('span', default=None)
+
+
+def current() -> Optional[Span]:
+    return _CURRENT.get()
+
+
+def activate(span: Span) -> Token:
+    return _CURRENT.set(span)
+
+
+def deactivate(token: Token) -> None:
+    _CURRENT.reset(token)
+
+
+def detached() -> Context:
+    """
+    Cópia do contexto atual fora de qualquer trace, para tarefas em segundo
+    plano que não devem prender o trace de quem as criou.
+    """
+    context = copy_context()
+    context.run(_CURRENT.set, None)
+    return context
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes: Any) -> Optional[Span]:
+    """
+    Abre um sub-trecho do trecho atual. Fora de um trace (ou sem amostragem)
+    retorna `None` e nada é registrado.
+    """
+    parent = parent or current()
+
+    # Trace já exportado: trechos atrasados não entram mais nele.
+    if parent is None or parent.trace.open == 0:
+        return None
+
+    span = Span(parent.trace, name, attributes)
+    parent.children.append(span)
+    parent.trace.open += 1
+    return span
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Cronometra o bloco como sub-trecho do trecho atual.
+    """
+    child = start_span(name, **attributes)
+
+    if child is None:
+        yield None
+        return
+
+    token = activate(child)
+
+    try:
+        yield child
+    except BaseException as e:
+        child.attributes['error'] = repr(e)
+        raise
+    finally:
+        deactivate(token)
+        child.finish()
+
+
+def render(span: Span, depth: int = 0) -> List[str]:
+    """
+    Árvore do trecho em texto, uma linha por trecho.
+    """
+    attributes = ' '.join(f'{k}={v}' for k, v in span.attributes.items())
+    lines = [f'{"  " * depth}{span.name} {span.duration * 1000:.1f}ms {attributes}'.rstrip()]
+
+    for child in span.children:
+        lines.extend(render(child, depth + 1))
+
+    return lines
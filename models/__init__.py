@@ -1,12 +1,21 @@
-import json
+import asyncio
 import logging
-from typing import List, Self
+import re
+from collections import defaultdict
+from time import perf_counter, time
+from typing import Any, Dict, List, Optional, Self, Tuple
 
 import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+from sqlalchemy import Table, event, inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import DeclarativeBase
 
 import settings
+from metrics import Gauge, Histogram, stats_gauge
+from metrics.tracing import span, start_span
 
 
 LOGGER = logging.getLogger(__name__)
@@ -19,55 +28,416 @@ class BaseTable(DeclarativeBase):
     pass
 
 
+def drop_indexes(conn, table: Table, names: Tuple[str, ...]) -> None:
+    """
+    Remove da tabela os índices obsoletos que ainda existirem. Para `run_sync`.
+    """
+    existing = {index['name'] for index in inspect(conn).get_indexes(table.name)}
+
+    for name in names:
+        if name in existing:
+            conn.execute(text(f'DROP INDEX {name} ON {table.name}'))
+            LOGGER.info('Dropped index %s from %s.', name, table.name)
+
+
+REDIS_LATENCY = Histogram('lunabot_redis_command_seconds', 'Redis round-trip latency.')
+
+
+class TimedPipeline(Pipeline):
+    """
+    Pipeline que mede o tempo de ida e volta do `execute`.
+    """
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        start = perf_counter()
+
+        try:
+            with span('redis', command='PIPELINE', size=len(self.command_stack)):
+                return await super().execute(raise_on_error)
+        finally:
+            REDIS_LATENCY.observe(perf_counter() - start, command='PIPELINE')
+
+
+class TimedRedis(redis.Redis):
+    """
+    Cliente Redis que mede o tempo de ida e volta de cada comando.
+    """
+    async def execute_command(self, *args, **options) -> Any:
+        start = perf_counter()
+
+        try:
+            with span('redis', command=str(args[0]).upper()):
+                return await super().execute_command(*args, **options)
+        finally:
+            REDIS_LATENCY.observe(perf_counter() - start, command=str(args[0]).upper())
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
 class RedisOrm:
-    def __init__(self) -> None:
-        self.pool = redis\
-            .BlockingConnectionPool(decode_responses=True)\
-            .from_url(settings.REDIS_URI)
+    """
+    Cliente Redis compartilhado por todo o processo.
+
+    O pool é criado uma única vez (na inicialização do bot) e emprestado a cada
+    `async with RedisOrm()`, evitando abrir e derrubar conexões por comando.
+    """
+    pool: Optional[redis.BlockingConnectionPool] = None
+    client: Optional[redis.Redis] = None
+
+    @classmethod
+    async def connect(cls) -> redis.Redis:
+        """
+        Cria o pool de conexões, caso ainda não exista.
+        """
+        if cls.client is None:
+            cls.pool = redis.BlockingConnectionPool.from_url(
+                settings.REDIS_URI,
+                decode_responses=True,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+                health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            )
+            cls.client = TimedRedis(connection_pool=cls.pool)
+            LOGGER.info('Redis pool created with %s max connections.', settings.REDIS_MAX_CONNECTIONS)
+
+        return cls.client
+
+    @classmethod
+    async def disconnect(cls) -> None:
+        """
+        Encerra o cliente e todas as conexões do pool.
+        """
+        if cls.client is None:
+            return
+
+        LOGGER.info('Closing Redis pool. Stats: %s', cls.stats())
+        await cls.client.aclose()
+        await cls.pool.disconnect()
+        cls.client = None
+        cls.pool = None
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        """
+        Estatísticas do pool para monitoramento.
+        """
+        if cls.pool is None:
+            return {'max': 0, 'created': 0, 'in_use': 0, 'available': 0}
+
+        in_use = len(cls.pool._in_use_connections)
+        available = len([c for c in cls.pool._available_connections if c is not None])
+
+        return {
+            'max': cls.pool.max_connections,
+            'created': in_use + available,
+            'in_use': in_use,
+            'available': available,
+        }
 
     async def __aenter__(self) -> redis.Redis:
-        self.client = redis.Redis(connection_pool=self.pool)
-        return self.client
+        return await self.connect()
 
     async def __aexit__(self, excp_a, excp_b, excp_c) -> None:
-        await self.pool.disconnect()
-        await self.client.close()
+        # As conexões voltam sozinhas para o pool, que vive até o `disconnect`.
+        pass
 
 
 class Cache:
     """
-    Cache da lista de últimos ID's dos quotes retornados durante o uso do BOT.
+    Histórico dos últimos ID's dos quotes retornados durante o uso do BOT.
+
+    Guardado num sorted set pontuado pelo horário de uso, limitado a uma janela
+    proporcional à quantidade de quotes do servidor.
     """
     def __init__(self, server: str) -> Self:
-        self.key = f'c:{server}'
+        self.key = f'ch:{server}'
+
+    async def insert(self, id: int, total: int) -> None:
+        """
+        Adiciona o ID no histórico e descarta os mais antigos fora da janela.
+        """
+        window = int(total * settings.CACHE_WINDOW)
+
+        try:
+            async with RedisOrm() as cache:
+                async with cache.pipeline(transaction=False) as pipe:
+                    pipe.zadd(self.key, {id: time()})
+                    pipe.zremrangebyrank(self.key, 0, -(window + 1))
+                    await pipe.execute()
+        except Exception as e:
+            LOGGER.error(f'Cannot insert id on Redis.\nCause: {e}')
 
-    async def insert(self, data: List[int]) -> None:
+    async def contains(self, id: int) -> bool:
         """
-        Adiciona a lista no cache.
+        Verifica se o ID está no histórico.
         """
         try:
             async with RedisOrm() as cache:
-                await cache.set(self.key, json.dumps(data))
+                return await cache.zscore(self.key, id) is not None
         except Exception as e:
-            LOGGER.error(f'Cannot insert list on Redis.\nCause: {e}')
+            LOGGER.error(f'Cannot check id on Redis.\nCause: {e}')
+            return False
 
     async def get(self) -> List[int]:
         """
-        Captura a lista do cache.
+        Captura os ID's do histórico, do mais antigo ao mais recente.
         """
         try:
             async with RedisOrm() as cache:
-                data = await cache.get(self.key)
+                data = await cache.zrange(self.key, 0, -1)
 
-            return json.loads(data) if data else []
+            return [int(d) for d in data]
         except Exception as e:
             LOGGER.error(f'Cannot get list from Redis.\nCause: {e}')
             return []
 
 
+class WriteBehind:
+    """
+    Buffer de escritas no Redis fora do caminho dos comandos.
+
+    Incrementos e valores são acumulados em memória e gravados num único
+    pipeline a cada `interval` segundos, ou antes disso ao juntar
+    `max_events` escritas. O que sobrar é gravado no `close`.
+    """
+    def __init__(self, interval: float, max_events: int) -> None:
+        self.interval = interval
+        self.max_events = max_events
+        self.counters: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.values: Dict[str, Any] = {}
+        # Valores do pipeline em andamento, visíveis até o `execute` retornar.
+        self.flushing: Dict[str, Any] = {}
+        self.events = 0
+        self.flushes = 0
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _added(self) -> None:
+        self.events += 1
+
+        if self.events >= self.max_events:
+            self._wake.set()
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> None:
+        self.counters[('hincrby', key, field)] += amount
+        self._added()
+
+    def zincrby(self, key: str, member: str, amount: int = 1) -> None:
+        self.counters[('zincrby', key, member)] += amount
+        self._added()
+
+    def set(self, key: str, value: Any) -> None:
+        self.values[key] = value
+        self._added()
+
+    def pending(self, key: str) -> Optional[Any]:
+        """
+        Valor ainda não gravado da chave, para leituras não voltarem atrás.
+        """
+        if key in self.values:
+            return self.values[key]
+
+        return self.flushing.get(key)
+
+    async def flush(self) -> None:
+        """
+        Grava tudo o que está acumulado num único pipeline.
+        """
+        if not self.counters and not self.values:
+            return
+
+        counters, self.counters = self.counters, defaultdict(int)
+        values, self.values = self.values, {}
+        self.flushing = values
+        self.events = 0
+        self._wake.clear()
+
+        try:
+            async with RedisOrm() as client:
+                async with client.pipeline(transaction=False) as pipe:
+                    for (op, key, field), amount in counters.items():
+                        if op == 'hincrby':
+                            pipe.hincrby(key, field, amount)
+                        else:
+                            pipe.zincrby(key, amount, field)
+
+                    for key, value in values.items():
+                        pipe.set(key, value)
+
+                    # Sem levantar no primeiro erro: o Redis já aplicou os
+                    # outros comandos e eles não podem voltar ao buffer.
+                    results = await pipe.execute(raise_on_error=False)
+        except asyncio.CancelledError:
+            # Interrompido no meio: devolve tudo, preferindo repetir a perder.
+            self._requeue(counters, values)
+            raise
+        except Exception as e:
+            # Nada foi confirmado: devolve tudo para tentar no próximo ciclo.
+            self.failures += 1
+            self._requeue(counters, values)
+            LOGGER.error(f'Cannot flush write-behind buffer.\nCause: {e}')
+            return
+        finally:
+            self.flushing = {}
+
+        items = [('counter', item) for item in counters] + [('value', key) for key in values]
+        retry_counters: Dict[Tuple[str, str, str], int] = {}
+        retry_values: Dict[str, Any] = {}
+
+        for (kind, item), result in zip(items, results):
+            if not isinstance(result, Exception):
+                continue
+
+            self.failures += 1
+
+            if isinstance(result, ResponseError):
+                # Erro do comando (ex.: WRONGTYPE) se repetiria para sempre.
+                LOGGER.error(f'Dropping write-behind entry {item}.\nCause: {result}')
+            elif kind == 'counter':
+                retry_counters[item] = counters[item]
+            else:
+                retry_values[item] = values[item]
+
+        self._requeue(retry_counters, retry_values)
+        self.flushes += 1
+
+    def _requeue(self, counters: Dict[Tuple[str, str, str], int], values: Dict[str, Any]) -> None:
+        for item, amount in counters.items():
+            self.counters[item] += amount
+
+        for key, value in values.items():
+            # Um valor novo gravado durante o flush tem prioridade.
+            self.values.setdefault(key, value)
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            await self.flush()
+
+    def start(self) -> None:
+        if not self.running:
+            self._wake = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run(), name='write-behind')
+
+    async def close(self) -> None:
+        """
+        Para o ciclo e grava o que restou.
+
+        O ciclo não é cancelado: termina o flush em andamento (cujos buffers
+        já saíram de `counters`/`values`) e sai na próxima volta.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+
+            try:
+                await self._task
+            except Exception as e:
+                LOGGER.error(f'Write-behind loop failed.\nCause: {e}')
+
+            self._task = None
+
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Estatísticas do buffer para monitoramento.
+        """
+        return {
+            'pending': len(self.counters) + len(self.values),
+            'flushes': self.flushes,
+            'failures': self.failures,
+        }
+
+
+WRITE_BEHIND = WriteBehind(
+    interval=settings.WRITE_BEHIND_INTERVAL / 1000,
+    max_events=settings.WRITE_BEHIND_MAX_EVENTS,
+)
+
+stats_gauge('lunabot_redis_pool', 'Redis connection pool usage.', RedisOrm.stats)
+stats_gauge('lunabot_write_behind', 'Write-behind buffer state.', WRITE_BEHIND.stats)
+
+
+SQL_LATENCY = Histogram('lunabot_sql_statement_seconds', 'SQL statement latency.')
+SQL_POOL_WAIT = Histogram('lunabot_sql_pool_wait_seconds', 'Time waiting for a pooled SQL connection.')
+# Textos de SQL distintos já executados; com as consultas fixas, deve ficar estável.
+SQL_STATEMENTS = set()
+Gauge('lunabot_sql_distinct_statements', 'Distinct SQL statements executed.', lambda: len(SQL_STATEMENTS))
+
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+`?(\w+)', re.IGNORECASE)
+
+
+def statement_label(statement: str) -> str:
+    """
+    Rótulo curto da instrução (`SELECT quotes`), para agrupar as latências.
+    """
+    operation = statement.split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+    table = _TABLE.search(statement)
+    return f'{operation} {table.group(1)}' if table else operation
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """
+    Pool que mede quanto tempo cada checkout espera por uma conexão.
+    """
+    def _do_get(self):
+        start = perf_counter()
+
+        try:
+            return super()._do_get()
+        finally:
+            SQL_POOL_WAIT.observe(perf_counter() - start)
+
+
 sql_engine = create_async_engine(
     settings.MARIADB_URI,
-    echo_pool=True,
+    poolclass=TimedPool,
+    echo_pool=settings.SQL_ECHO_POOL,
     pool_pre_ping=True,
-    pool_recycle=600,
+    pool_size=settings.SQL_POOL_SIZE,
+    max_overflow=settings.SQL_MAX_OVERFLOW,
+    pool_timeout=settings.SQL_POOL_TIMEOUT,
+    pool_recycle=settings.SQL_POOL_RECYCLE,
 )
+
+
+@event.listens_for(sql_engine.sync_engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._started_at = perf_counter()
+    # O greenlet do SQLAlchemy herda o contexto do comando, então o trecho cai no trace certo.
+    context._span = start_span('sql', statement=statement_label(statement))
+
+
+@event.listens_for(sql_engine.sync_engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    SQL_LATENCY.observe(perf_counter() - context._started_at, statement=statement_label(statement))
+    SQL_STATEMENTS.add(statement)
+
+    if context._span is not None:
+        context._span.finish()
+
+
+@event.listens_for(sql_engine.sync_engine, 'handle_error')
+def _handle_error(exception_context) -> None:
+    context = exception_context.execution_context
+    sql_span = getattr(context, '_span', None)
+
+    if sql_span is not None:
+        sql_span.finish(error=repr(exception_context.original_exception))
+
+
+Gauge('lunabot_sql_pool_checked_out', 'SQL connections in use.', lambda: sql_engine.pool.checkedout())
@@ -0,0 +1,110 @@
+import logging
+from typing_extensions import List, Optional
+
+from models import RedisOrm
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Deck:
+    """
+    Baralho de IDs de quotes por servidor.
+
+    Cada `draw` tira um ID aleatório do baralho (SPOP) até ele acabar; aí o
+    baralho é reabastecido com todos os IDs do servidor de uma vez só.
+    """
+    def __init__(self, server: str) -> None:
+        self.key = f'd:{server}'
+        self.size_key = f'dn:{server}'
+
+    async def draw(self) -> Optional[int]:
+        """
+        Retira um ID aleatório do baralho. Retorna `None` se estiver vazio.
+        """
+        try:
+            async with RedisOrm() as client:
+                data = await client.spop(self.key)
+
+            return int(data) if data else None
+        except Exception as e:
+            LOGGER.debug(e)
+            raise e
+
+    async def fill(self, ids: List[int], total: int) -> None:
+        """
+        Substitui o baralho pelos `ids` e guarda o total de quotes do servidor.
+        """
+        try:
+            async with RedisOrm() as client:
+                async with client.pipeline(transaction=True) as pipe:
+                    pipe.delete(self.key)
+
+                    if ids:
+                        pipe.sadd(self.key, *ids)
+
+                    pipe.set(self.size_key, total)
+                    await pipe.execute()
+        except Exception as e:
+            LOGGER.debug(e)
+            raise e
+
+        LOGGER.info('Deck %s filled with %s of %s quotes.', self.key, len(ids), total)
+
+    async def reset(self) -> None:
+        """
+        Descarta o baralho para ele ser reabastecido no próximo `draw`.
+        """
+        try:
+            async with RedisOrm() as client:
+                await client.delete(self.key, self.size_key)
+        except Exception as e:
+            LOGGER.debug(e)
+            raise e
+
+    async def add(self, id: int) -> None:
+        """
+        Coloca um quote novo no baralho, se ele já existir.
+        """
+        try:
+            async with RedisOrm() as client:
+                if not await client.exists(self.size_key):
+                    return
+
+                async with client.pipeline(transaction=True) as pipe:
+                    pipe.sadd(self.key, id)
+                    pipe.incr(self.size_key)
+                    await pipe.execute()
+        except Exception as e:
+            LOGGER.debug(e)
+            raise e
+
+    async def discard(self, id: int) -> None:
+        """
+        Tira um quote removido do baralho.
+        """
+        try:
+            async with RedisOrm() as client:
+                if not await client.exists(self.size_key):
+                    return
+
+                async with client.pipeline(transaction=True) as pipe:
+                    pipe.srem(self.key, id)
+                    pipe.decr(self.size_key)
+                    await pipe.execute()
+        except Exception as e:
+            LOGGER.debug(e)
+            raise e
+
+    async def total(self) -> int:
+        """
+        Total de quotes do servidor no último reabastecimento.
+        """
+        try:
+            async with RedisOrm() as client:
+                data = await client.get(self.size_key)
+
+            return int(data) if data else 0
+        except Exception as e:
+            LOGGER.debug(e)
+            raise e
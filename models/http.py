@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing_extensions import Dict, NamedTuple, Optional
+
+import aiohttp
+
+import settings
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Response(NamedTuple):
+    status: int
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class HttpClient:
+    """
+    Sessão HTTP assíncrona compartilhada pelo processo.
+
+    Mantém as conexões vivas entre as requisições e é aberta e fechada junto
+    com o bot, assim como o `RedisOrm`.
+    """
+    session: Optional[aiohttp.ClientSession] = None
+
+    @classmethod
+    async def connect(cls) -> aiohttp.ClientSession:
+        """
+        Cria a sessão, caso ainda não exista.
+        """
+        if cls.session is None or cls.session.closed:
+            cls.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=settings.HTTP_MAX_CONNECTIONS,
+                    keepalive_timeout=settings.HTTP_KEEPALIVE,
+                ),
+                headers={'User-Agent': settings.HTTP_USER_AGENT},
+            )
+
+        return cls.session
+
+    @classmethod
+    async def disconnect(cls) -> None:
+        """
+        Fecha a sessão e suas conexões.
+        """
+        if cls.session is not None:
+            await cls.session.close()
+            cls.session = None
+
+    @classmethod
+    async def get(cls, url: str, timeout: float, headers: Optional[Dict[str, str]] = None) -> Response:
+        """
+        Baixa o conteúdo da URL, tentando de novo com espera exponencial em
+        caso de erro de rede, timeout ou resposta 5xx.
+        """
+        session = await cls.connect()
+        attempts = settings.HTTP_RETRIES + 1
+
+        for attempt in range(attempts):
+            try:
+                async with session.get(
+                    url,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as response:
+                    if response.status < 500:
+                        response.raise_for_status()
+                        return Response(
+                            status=response.status,
+                            body=await response.read(),
+                            etag=response.headers.get('ETag'),
+                            last_modified=response.headers.get('Last-Modified'),
+                        )
+
+                    error = aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=response.reason,
+                    )
+            except aiohttp.ClientResponseError as e:
+                if e.status < 500:
+                    raise e
+
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+
+            if attempt + 1 < attempts:
+                delay = settings.HTTP_BACKOFF * 2 ** attempt
+                LOGGER.warning('GET %s failed (%r), retrying in %ss.', url, error, delay)
+                await asyncio.sleep(delay)
+
+        LOGGER.error('GET %s failed after %s attempts.', url, attempts)
+        raise error
@@ -1,103 +1,155 @@
 import logging
-from typing_extensions import Dict, Optional
+from typing_extensions import Dict, Iterable, List, Optional, Tuple
 
-from models import RedisOrm
+from models import WRITE_BEHIND, RedisOrm
 
 
 LOGGER = logging.getLogger(__name__)
 
 
+def ranking_key(key: str) -> str:
+    """
+    Chave do sorted set que espelha o hash de contadores `key`.
+    """
+    return f'z{key}'
+
+
 class Indicators:
     def __init__(self, server: str) -> None:
         self.qkey = f'q:{server}'
         self.rqkey = f'rq:{server}'
 
-    async def q_usage(self, username: str) -> None:
+    async def incr(self, counters: Iterable[Tuple[str, str, int]]) -> None:
         """
-        Adiciona no contador do comando quotes.
+        Incrementa vários contadores `(chave, usuário, quantidade)` de uma vez.
+        Tudo vai num único pipeline e o incremento é atômico no Redis.
+        O ranking (sorted set) é mantido junto com o hash.
         """
         try:
-            LOGGER.info('Add one more quote to %s', username)
-            _indicator = await self.q_get()
-
             async with RedisOrm() as client:
-                if not _indicator:
-                    await client.hmset(
-                        self.qkey,
-                        {
-                            username: 1
-                        }
-                    )
-                elif not _indicator.get(username):
-                    _indicator[username] = 1
-                else:
-                    _indicator[username] += 1
-
-                await client.hmset(
-                    self.qkey,
-                    _indicator,
-                )
+                async with client.pipeline(transaction=False) as pipe:
+                    for key, username, amount in counters:
+                        pipe.hincrby(key, username, amount)
+                        pipe.zincrby(ranking_key(key), amount, username)
 
+                    await pipe.execute()
         except Exception as e:
             LOGGER.debug(e)
             raise e
 
+    async def _usage(self, key: str, username: str) -> None:
+        # Com o buffer rodando, a escrita sai do caminho do comando.
+        if WRITE_BEHIND.running:
+            WRITE_BEHIND.hincrby(key, username)
+            WRITE_BEHIND.zincrby(ranking_key(key), username)
+        else:
+            await self.incr([(key, username, 1)])
+
+    async def q_usage(self, username: str) -> None:
+        """
+        Adiciona no contador do comando quotes.
+        """
+        LOGGER.info('Add one more quote to %s', username)
+        await self._usage(self.qkey, username)
+
     async def rq_usage(self, username: str) -> None:
         """
         Adiciona no contador do comando randomquote.
         """
-        try:
-            LOGGER.info('Add one more random quote to %s', username)
-            _indicator = await self.rq_get()
+        LOGGER.info('Add one more random quote to %s', username)
+        await self._usage(self.rqkey, username)
 
+    async def _get(self, key: str) -> Optional[Dict[str, int]]:
+        try:
             async with RedisOrm() as client:
-                if not _indicator:
-                    await client.hmset(
-                        self.rqkey,
-                        {
-                            username: 1
-                        }
-                    )
-                elif not _indicator.get(username):
-                    _indicator[username] = 1
-                else:
-                    _indicator[username] += 1
-
-                await client.hmset(
-                    self.rqkey,
-                    _indicator,
-                )
+                content = await client.hgetall(key)
 
+            return {k: int(v) for k, v in content.items()}
         except Exception as e:
             LOGGER.debug(e)
             raise e
 
-    async def q_get(self) -> Optional[Dict]:
+    async def q_get(self) -> Optional[Dict[str, int]]:
         """
         Captura o indicador de quotadores do server.
         """
+        LOGGER.info('Getting quoters for server %s', self.qkey)
+        return await self._get(self.qkey)
+
+    async def rq_get(self) -> Optional[Dict[str, int]]:
+        """
+        Captura o indicador de requisitores do server.
+        """
+        LOGGER.info('Getting requesters for server %s', self.rqkey)
+        return await self._get(self.rqkey)
+
+    async def _top(self, key: str, quantity: int) -> List[Tuple[str, int]]:
         try:
-            LOGGER.info('Getting quoters for server %s', self.qkey)
-            
             async with RedisOrm() as client:
-                content = await client.hgetall(self.qkey)
+                content = await client.zrevrange(
+                    ranking_key(key), 0, quantity - 1, withscores=True)
 
-            return content
+            return [(username, int(score)) for username, score in content]
         except Exception as e:
             LOGGER.debug(e)
             raise e
 
-    async def rq_get(self) -> Optional[Dict]:
-        """
-        Captura o indicador de requisitores do server.
-        """
+    async def _rank(self, key: str, username: str) -> Optional[int]:
         try:
-            LOGGER.info('Getting requesters for server %s', self.rqkey)
-
             async with RedisOrm() as client:
-                content = await client.hgetall(self.rqkey)
+                rank = await client.zrevrank(ranking_key(key), username)
 
-            return content
+            return rank + 1 if rank is not None else None
         except Exception as e:
             LOGGER.debug(e)
             raise e
+
+    async def q_top(self, quantity: int) -> List[Tuple[str, int]]:
+        """
+        Top `quantity` quotadores do server, do maior para o menor.
+        """
+        return await self._top(self.qkey, quantity)
+
+    async def rq_top(self, quantity: int) -> List[Tuple[str, int]]:
+        """
+        Top `quantity` requisitores do server, do maior para o menor.
+        """
+        return await self._top(self.rqkey, quantity)
+
+    async def q_rank(self, username: str) -> Optional[int]:
+        """
+        Posição (a partir de 1) do usuário no ranking de quotadores.
+        """
+        return await self._rank(self.qkey, username)
+
+    async def rq_rank(self, username: str) -> Optional[int]:
+        """
+        Posição (a partir de 1) do usuário no ranking de requisitores.
+        """
+        return await self._rank(self.rqkey, username)
+
+    @staticmethod
+    async def backfill() -> int:
+        """
+        Reconstrói os rankings a partir dos hashes `q:` e `rq:` existentes.
+        Retorna a quantidade de rankings gravados.
+        """
+        total = 0
+
+        async with RedisOrm() as client:
+            for pattern in ('q:*', 'rq:*'):
+                async for key in client.scan_iter(match=pattern, _type='hash'):
+                    content = await client.hgetall(key)
+
+                    if not content:
+                        continue
+
+                    async with client.pipeline(transaction=True) as pipe:
+                        pipe.delete(ranking_key(key))
+                        pipe.zadd(ranking_key(key), {k: int(v) for k, v in content.items()})
+                        await pipe.execute()
+
+                    LOGGER.info('Backfilled %s with %s users.', ranking_key(key), len(content))
+                    total += 1
+
+        return total
@@ -0,0 +1,71 @@
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing_extensions import Any, Dict, Hashable, Optional
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Cache em memória com descarte do menos usado e tempo de vida por item.
+    """
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Retorna o valor da chave, ou `None` se não existir ou tiver expirado.
+        """
+        item = self._data.get(key)
+
+        if item is None or item[1] < monotonic():
+            if item is not None:
+                del self._data[key]
+
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Guarda o valor, descartando o item menos usado se passar do limite.
+        """
+        if self.maxsize <= 0:
+            return
+
+        self._data[key] = (value, monotonic() + self.ttl)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Invalida a chave.
+        """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Estatísticas de uso para monitoramento.
+        """
+        total = self.hits + self.misses
+
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'ratio': self.hits / total if total else 0.0,
+        }
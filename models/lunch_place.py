@@ -1,21 +1,27 @@
+import json
 import logging
 from datetime import datetime
-from typing_extensions import Self, Optional, List
-from random import choice
+from typing_extensions import AsyncIterator, Dict, Self, Optional, List, Tuple
+from random import choice, choices, random, randrange
 
-from sqlalchemy import  select, update, delete, insert, text
-from sqlalchemy import BigInteger, DateTime, String, Text, Uuid, Index
+from sqlalchemy import  select, update, delete, insert, bindparam
+from sqlalchemy import BigInteger, DateTime, Integer, String, Text, Uuid, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import BaseTable, sql_engine
+import settings
+from models import BaseTable, RedisOrm, drop_indexes, sql_engine
+from models.lru import LRUCache
 
 LOGGER = logging.getLogger(__name__)
 
+# Locais de almoço de cada servidor: (ids, {id: local}).
+CANDIDATES = LRUCache(settings.LUNCH_CACHE_SIZE, settings.LUNCH_MEMORY_TTL)
+
 
 class LunchPlace(BaseTable):
     __tablename__ = 'lunch_place'
-    __table_args__ = (Index('lunch_place_srv_idx', 'server'), )
+    __table_args__ = (Index('lunch_place_srv_id_idx', 'server', 'id'), )
 
     id: Mapped[BigInteger] = mapped_column(BigInteger(), primary_key=True, autoincrement=True)
     place: Mapped[String] = mapped_column(Text(), nullable=False)
@@ -43,8 +49,10 @@ class LunchPlace(BaseTable):
                     created_at=self.created_at,
                 )
                 cursor = await session.execute(stmt)
-                session.commit()
+                await session.commit()
                 self.id = cursor.inserted_primary_key[0]
+
+            await self.invalidate(self.server)
         except Exception as e:
             LOGGER.error('Can not create lunch place %s.\n%s' % (self, e))
             raise e
@@ -57,8 +65,7 @@ class LunchPlace(BaseTable):
         """
         try:
             async with AsyncSession(sql_engine) as session:
-                stmt = select(LunchPlace).where(LunchPlace.id == id)
-                cursor = await session.execute(stmt)
+                cursor = await session.execute(GET_STMT, {'id': id})
                 quote = cursor.scalar_one_or_none()
                 return quote
         except Exception as e:
@@ -75,7 +82,7 @@ class LunchPlace(BaseTable):
 
         try:
             async with AsyncSession(sql_engine) as session:
-                stmt = select(LunchPlace).where(server == self.server)
+                stmt = select(LunchPlace).where(LunchPlace.server == server)
                 cursor  = await session.execute(stmt)
                 response = cursor.scalars().all()
             return response
@@ -83,7 +90,41 @@ class LunchPlace(BaseTable):
             LOGGER.error('Can not get all lunch places cause: %s', e)
             raise e
 
-    async def get_ids_by_server(self, server: str) -> List[str]:
+    async def page(self, server: str, after: Optional[int] = None, limit: int = settings.PAGE_SIZE) -> List[Self]:
+        """
+        Retorna até `limit` locais de almoço do servidor com id maior que `after`.
+        Paginação por chave, sempre pelo índice (server, id).
+        """
+        try:
+            async with AsyncSession(sql_engine) as session:
+                cursor = await session.execute(PAGE_STMT, {
+                    'server': str(server),
+                    'after': after or 0,
+                    'limit': limit,
+                })
+                return cursor.scalars().all()
+        except Exception as e:
+            LOGGER.error(e)
+            raise e
+
+    async def iterate(self, server: str, batch: int = settings.PAGE_SIZE) -> AsyncIterator[Self]:
+        """
+        Percorre todos os locais de almoço do servidor, uma página por vez.
+        """
+        after = None
+
+        while True:
+            rows = await self.page(server, after, batch)
+
+            for row in rows:
+                yield row
+
+            if len(rows) < batch:
+                return
+
+            after = rows[-1].id
+
+    async def get_ids_by_server(self, server: str) -> List[int]:
         """
         Retorna uma lista de IDs baseado no servidor.
         """
@@ -93,17 +134,130 @@ class LunchPlace(BaseTable):
 
         try:
             async with AsyncSession(sql_engine) as session:
-                stmt = text(f'''
-                    select id
-                    from lunch_place
-                    where server = '{server}';
-                ''')
-                cursor = await session.execute(stmt)
+                cursor = await session.execute(IDS_STMT, {'server': str(server)})
                 return cursor.scalars().all()
         except Exception as e:
             LOGGER.error(e)
             raise e
 
+    async def candidates(self, server: str) -> Tuple[Tuple[int, ...], Dict[int, Dict]]:
+        """
+        Locais de almoço do servidor, da memória, do Redis ou do banco, nessa ordem.
+        """
+        key = str(server)
+        data = CANDIDATES.get(key)
+
+        if data is not None:
+            return data
+
+        try:
+            async with RedisOrm() as client:
+                raw = await client.hgetall(f'lp:{server}')
+
+            if raw:
+                rows = {int(k): json.loads(v) for k, v in raw.items()}
+            else:
+                async with AsyncSession(sql_engine) as session:
+                    cursor = await session.execute(SERVER_STMT, {'server': str(server)})
+                    rows = {
+                        place.id: {
+                            'place': place.place,
+                            'created_by': place.created_by,
+                            'created_at': place.created_at.isoformat(),
+                        }
+                        for place in cursor.scalars()
+                    }
+
+                if rows:
+                    async with RedisOrm() as client:
+                        async with client.pipeline(transaction=True) as pipe:
+                            pipe.hset(f'lp:{server}', mapping={k: json.dumps(v) for k, v in rows.items()})
+                            pipe.expire(f'lp:{server}', int(settings.LUNCH_CACHE_TTL))
+                            await pipe.execute()
+        except Exception as e:
+            LOGGER.error(e)
+            raise e
+
+        data = (tuple(rows), rows)
+        CANDIDATES.set(key, data)
+        return data
+
+    @staticmethod
+    async def invalidate(server: Optional[str]) -> None:
+        """
+        Descarta os locais guardados do servidor (ou de todos, sem servidor),
+        na memória e no Redis.
+        """
+        if server is None:
+            CANDIDATES.clear()
+        else:
+            CANDIDATES.pop(str(server))
+
+        try:
+            async with RedisOrm() as client:
+                if server is None:
+                    async for key in client.scan_iter(match='lp:*'):
+                        await client.delete(key)
+                else:
+                    await client.delete(f'lp:{server}')
+        except Exception as e:
+            LOGGER.error('Cannot invalidate lunch places on Redis.\nCause: %s', e)
+
+    async def pick(self, server: str) -> Optional[Self]:
+        """
+        Sorteia um local de almoço, com menos chance para os escolhidos há pouco.
+
+        O peso de um local escolhido `n` sorteios atrás (0 é o último) é
+        `1 - LUNCH_DECAY ** n`, nunca menor que `LUNCH_MIN_WEIGHT`; os demais
+        pesam 1. O sorteio é
+        por rejeição: tira um local qualquer e aceita com a chance do seu peso.
+        """
+        ids, rows = await self.candidates(server)
+
+        if not ids:
+            return None
+
+        history_key = f'lh:{server}'
+
+        try:
+            async with RedisOrm() as client:
+                history = await client.lrange(history_key, 0, settings.LUNCH_HISTORY - 1)
+        except Exception as e:
+            LOGGER.error(e)
+            raise e
+
+        weights = {}
+
+        for age, id in enumerate(history):
+            weights.setdefault(int(id), max(settings.LUNCH_MIN_WEIGHT, 1 - settings.LUNCH_DECAY ** age))
+
+        for _ in range(settings.LUNCH_PICK_ATTEMPTS):
+            id = ids[randrange(len(ids))]
+
+            if random() < weights.get(id, 1):
+                break
+        else:
+            id = choices(ids, weights=[weights.get(i, 1) for i in ids])[0]
+
+        try:
+            async with RedisOrm() as client:
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.lpush(history_key, id)
+                    pipe.ltrim(history_key, 0, settings.LUNCH_HISTORY - 1)
+                    await pipe.execute()
+        except Exception as e:
+            LOGGER.error(e)
+            raise e
+
+        row = rows[id]
+        return LunchPlace(
+            id=id,
+            place=row['place'],
+            server=str(server),
+            created_by=row['created_by'],
+            created_at=datetime.fromisoformat(row['created_at']),
+        )
+
     async def update(self) -> None:
         """
         Altera um local de almoço.
@@ -115,10 +269,12 @@ class LunchPlace(BaseTable):
                     .values(place=self.place)
                 await session.execute(stmt)
                 await session.commit()
+
+            await self.invalidate(self.server)
         except Exception as e:
             LOGGER.error(e)
 
-    async def delete(self, id: Optional[Uuid]) -> None:
+    async def delete(self, id: Optional[Uuid] = None) -> None:
         """
         Remove um local de almoço do banco de dados.
         """
@@ -126,12 +282,23 @@ class LunchPlace(BaseTable):
 
         if not id:
             LOGGER.error('Can not delete id %s', id)
+            return
 
         try:
             async with AsyncSession(sql_engine) as session:
-                stmt = await delete(LunchPlace).where(LunchPlace.id == id)
+                # O servidor vem da própria linha: a instância pode não ter um.
+                cursor = await session.execute(GET_STMT, {'id': id})
+                place = cursor.scalar_one_or_none()
+
+                if place is None:
+                    LOGGER.warning('Lunch place %s not found.', id)
+                    return
+
+                stmt = delete(LunchPlace).where(LunchPlace.id == id)
                 await session.execute(stmt)
                 await session.commit()
+
+            await self.invalidate(place.server)
         except Exception as e:
             LOGGER.error(e)
         else:
@@ -142,6 +309,13 @@ class LunchPlace(BaseTable):
         async with sql_engine.begin() as session:
             await session.run_sync(LunchPlace.metadata.create_all)
 
+            # O create_all não cria índices novos em tabelas que já existem.
+            for index in LunchPlace.__table__.indexes:
+                await session.run_sync(index.create, checkfirst=True)
+
+            # O (server) antigo é prefixo do (server, id) e só pesa nas escritas.
+            await session.run_sync(drop_indexes, LunchPlace.__table__, ('lunch_place_srv_idx',))
+
     @staticmethod
     def get_random_intro() -> String:
         intros = [
@@ -168,4 +342,18 @@ class LunchPlace(BaseTable):
             'Acabei de perguntar pro ChatGPT um lugar pra almoçar, e ele disse'
         ]
 
-        return choice(intros)
\ No newline at end of file
+        return choice(intros)
+
+
+# Consultas quentes montadas uma única vez, sempre com parâmetros (ver
+# `models.quote`).
+_server = bindparam('server', type_=String())
+
+GET_STMT = select(LunchPlace).where(LunchPlace.id == bindparam('id'))
+IDS_STMT = select(LunchPlace.id).where(LunchPlace.server == _server)
+SERVER_STMT = select(LunchPlace).where(LunchPlace.server == _server)
+PAGE_STMT = select(LunchPlace)\
+    .where(LunchPlace.server == _server)\
+    .where(LunchPlace.id > bindparam('after'))\
+    .order_by(LunchPlace.id)\
+    .limit(bindparam('limit', type_=Integer()))
@@ -1,18 +1,47 @@
+import asyncio
+import json
 import logging
-from typing import Dict, List, Self
+from itertools import zip_longest
+from time import perf_counter, time
+from typing import Dict, List, Optional, Self, Tuple
 
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
 import settings
+from metrics import Histogram
+from metrics.tracing import detached, span
+from models import RedisOrm
+from models.http import HttpClient
 
 LOGGER = logging.getLogger(__name__)
 
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+NEWS_FETCH = Histogram('lunabot_news_fetch_seconds', 'News download and parse time per source.')
+
+# Última lista de notícias de cada fonte: (horário da captura, notícias).
+NEWS_CACHE: Dict[str, Tuple[float, List[Dict]]] = {}
+# Atualizações em andamento, para não baixar a mesma fonte duas vezes.
+REFRESHING: Dict[str, asyncio.Task] = {}
+# ETag e Last-Modified da última resposta de cada URL.
+VALIDATORS: Dict[str, Dict[str, str]] = {}
+
+
+def _log_refresh_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception():
+        LOGGER.error('Cannot refresh %s.\nCause: %s', task.get_name(), task.exception())
+
 
 class News:
     """
     Realiza web scraping para capturar notícias jornalisticas.
     """
+    SOURCES = tuple(settings.NEWS_SOURCES)
+
     new: str
     date: str
     link: str
@@ -31,96 +60,242 @@ class News:
                 LOGGER.error(e)
                 raise e
 
-    async def _get_from_bbc(self) -> List[Dict]:
+    async def _download(self, url: str, timeout: float) -> Optional[bytes]:
         """
-        Captura notícias da BBC.
+        Baixa a página com GET condicional. Retorna `None` se ela não mudou
+        desde a última captura (304).
         """
-        html = requests.get(settings.BBC_NEWS_URL).content
-        soup = BeautifulSoup(html, 'html.parser')
-        raw_html = soup.find('ul', class_='bbc-k6wdzo')
-        raw_news = raw_html.contents
-        news = []
+        headers = VALIDATORS.get(url) if self.source in NEWS_CACHE else None
+        response = await HttpClient.get(url, timeout, headers=headers)
 
-        for new in raw_news:
-            _new = new.find('h2').text
-            _date = new.find('time').text
-            _link = new.find('a').attrs.get('href')
-            _img = new.find('div', class_='promo-image').find('img').attrs.get('src')
-            news.append({
-                'new': _new,
-                'date': _date,
-                'link': _link,
-                'image': _img
-            })
+        if response.status == 304:
+            LOGGER.info('%s not modified, reusing parsed news.', url)
+            return None
 
-        return news
+        validators = {}
+
+        if response.etag:
+            validators['If-None-Match'] = response.etag
 
-    async def _get_from_cnn(self) -> List[Dict]:
+        if response.last_modified:
+            validators['If-Modified-Since'] = response.last_modified
+
+        VALIDATORS[url] = validators
+        return response.body
+
+    @staticmethod
+    def _parse(html: bytes, spec: Dict, limit: int) -> List[Dict]:
         """
-        Captura nítícias da CNN Brasil.
+        Extrai as notícias seguindo os seletores declarados para a fonte.
         """
-        html = requests.get(settings.CNN_NEWS_URL).content
-        soup = BeautifulSoup(html, 'html.parser')
-        raw_html = soup.find('div', class_='homepage__layout homepage__layout--seventy-thirty')
-        raw_html = raw_html.find('ul', 'home__new')
-        raw_news = raw_html.contents
+        tag, class_ = spec['container']
+        wanted = set(class_.split())
+
+        # O strainer compara o atributo `class` cru ("a b"), então a classe é
+        # procurada entre as várias do elemento, como no `find`.
+        def has_classes(value: Optional[str]) -> bool:
+            return bool(value) and wanted <= set(value.split())
+
+        soup = BeautifulSoup(html, PARSER, parse_only=SoupStrainer(tag, class_=has_classes))
+        raw_html = soup.find(tag, class_=has_classes)
+
+        if raw_html and spec.get('list'):
+            raw_html = raw_html.select_one(spec['list'])
+
+        if not raw_html:
+            LOGGER.warning('News container not found for %s.', spec['url'])
+            return []
+
         news = []
 
-        for new in raw_news:
-            if new == ' ': continue  # Os cara são foda.
+        for new in raw_html.find_all(True, recursive=False):
+            item = {}
+
+            for field, (selector, attr) in spec['fields'].items():
+                element = new.select_one(selector)
+
+                # Itens incompletos (sem título, por exemplo) são ignorados.
+                if element is None:
+                    break
 
-            _new = new.find('h3', class_='news-item-header__title').text
-            _date = new.find('span', class_='home__title__date').text
-            _link = new.find('a', class_='home__list__tag').attrs.get('href')
-            _img = new.find('img').attrs.get('src')
-            news.append({
-                'new': _new,
-                'date': _date,
-                'link': _link,
-                'image': _img
-            })
+                item[field] = element.text if attr == 'text' else element.attrs.get(attr)
+            else:
+                news.append(item)
+
+            if len(news) >= limit:
+                break
 
         return news
 
-    async def _get_from_tec_mundo(self) -> List[Dict]:
+    async def _fetch(self) -> List[Dict]:
         """
-        Captura informações do Olhar Digital.
+        Baixa e interpreta as notícias direto da fonte.
         """
-        html = requests.get(settings.TEC_MUNDO_URL).content
-        soup = BeautifulSoup(html, 'html.parser')
-        raw_html = soup.find('div', class_='tec--list tec--list--lg')
-        raw_news = raw_html.contents
-        news = []
+        spec = settings.NEWS_SOURCES.get(self.source)
 
-        for new in raw_news:
-            _new = new.find('a', class_='tec--card__title__link')
-            _date = new.find('div', class_='tec--timestamp__item z--min-w-none')
-            _link = new.find('a', class_='tec--card__title__link')
-            _img = new.find('img', class_='tec--card__thumb__image')
+        if not spec:
+            return []
 
-            if not _new: continue  # Sei lá porque, as vezes não vem nada.
+        html = await self._download(spec['url'], spec['timeout'])
 
-            news.append({
-                'new': _new.text,
-                'date': _date.text,
-                'link': _link.attrs.get('href'),
-                'image': _img.attrs.get('data-src'),
-            })
+        if html is None:
+            return NEWS_CACHE[self.source][1]
 
-        return news
+        return await asyncio.to_thread(self._parse, html, spec, settings.NEWS_LIMIT)
+
+    async def _load(self) -> Optional[Tuple[float, List[Dict]]]:
+        """
+        Recupera a lista compartilhada entre os processos no Redis.
+        """
+        try:
+            async with RedisOrm() as client:
+                data = await client.get(f'n:{self.source}')
+        except Exception as e:
+            LOGGER.error('Cannot get news from Redis.\nCause: %s', e)
+            return None
+
+        if not data:
+            return None
+
+        data = json.loads(data)
+        return data['at'], data['news']
+
+    async def refresh(self) -> List[Dict]:
+        """
+        Baixa a fonte e atualiza o cache em memória e no Redis.
+        """
+        start = perf_counter()
+
+        try:
+            data = await self._fetch()
+        except Exception as e:
+            NEWS_FETCH.observe(perf_counter() - start, source=self.source, result='error')
+            raise e
+
+        NEWS_FETCH.observe(perf_counter() - start, source=self.source, result='ok')
+        now = time()
+        NEWS_CACHE[self.source] = (now, data)
+
+        try:
+            async with RedisOrm() as client:
+                await client.set(
+                    f'n:{self.source}',
+                    json.dumps({'at': now, 'news': data}),
+                    ex=settings.NEWS_MAX_AGE,
+                )
+        except Exception as e:
+            LOGGER.error('Cannot save news on Redis.\nCause: %s', e)
+
+        LOGGER.info('Refreshed %s news from %s.', len(data), self.source)
+        return data
+
+    def _refresh_in_background(self) -> asyncio.Task:
+        """
+        Agenda uma atualização da fonte, reaproveitando a que já estiver rodando.
+        """
+        task = REFRESHING.get(self.source)
+
+        if task is None or task.done():
+            # Compartilhada entre comandos, então fica fora do trace de quem a criou.
+            task = asyncio.create_task(self.refresh(), name=f'news:{self.source}', context=detached())
+            task.add_done_callback(_log_refresh_failure)
+            REFRESHING[self.source] = task
+
+        return task
+
+    async def _refresh_if_stale(self) -> None:
+        """
+        Atualiza a fonte, a menos que outro processo já tenha gravado uma lista
+        recente no Redis; nesse caso só a traz para a memória.
+        """
+        stored = await self._load()
+
+        if stored and time() - stored[0] < settings.NEWS_REFRESH_INTERVAL:
+            entry = NEWS_CACHE.get(self.source)
+
+            if entry is None or stored[0] > entry[0]:
+                NEWS_CACHE[self.source] = stored
+
+            return
+
+        await self._refresh_in_background()
+
+    @classmethod
+    async def refresh_all(cls) -> None:
+        """
+        Atualiza todas as fontes ao mesmo tempo.
+        """
+        await asyncio.gather(
+            *[cls(source=source)._refresh_if_stale() for source in cls.SOURCES],
+            return_exceptions=True,
+        )
 
     async def get(self) -> List[Self]:
         """
         Captura notícias da fonte.
+
+        Serve do cache; se estiver velho, responde com ele mesmo e atualiza em
+        segundo plano. Só baixa na hora quando não há nada guardado.
         """
-        match self.source:
-            case 'bbc':
-                data = await self._get_from_bbc()
-            case 'cnn':
-                data = await self._get_from_cnn()
-            case 'tecmundo':
-                data = await self._get_from_tec_mundo()
-            case _:
-                data = []
+        if self.source not in self.SOURCES:
+            return []
+
+        entry = NEWS_CACHE.get(self.source)
+
+        if entry is None or time() - entry[0] > settings.NEWS_TTL:
+            stored = await self._load()
+
+            if stored and (entry is None or stored[0] > entry[0]):
+                entry = NEWS_CACHE[self.source] = stored
+
+        if entry is None:
+            # O shield mantém a atualização viva se quem espera for cancelado.
+            with span('news.refresh', source=self.source):
+                data = await asyncio.shield(self._refresh_in_background())
+        else:
+            if time() - entry[0] > settings.NEWS_TTL:
+                self._refresh_in_background()
+
+            data = entry[1]
 
         return [News(**d) for d in data]
+
+    @classmethod
+    async def digest(cls) -> List[Self]:
+        """
+        Junta as notícias de todas as fontes, buscadas ao mesmo tempo.
+
+        Só entram as fontes que responderem dentro de `NEWS_DIGEST_BUDGET`
+        segundos. As manchetes são intercaladas por fonte e as repetidas
+        (mesmo link) descartadas.
+        """
+        tasks = [asyncio.create_task(cls(source=source).get()) for source in cls.SOURCES]
+        done, pending = await asyncio.wait(tasks, timeout=settings.NEWS_DIGEST_BUDGET)
+
+        for task in pending:
+            task.cancel()
+
+        results = []
+
+        for task in tasks:
+            if task not in done:
+                continue
+
+            if task.exception():
+                LOGGER.error('Cannot get news for digest.\nCause: %s', task.exception())
+                continue
+
+            results.append(task.result())
+
+        news = []
+        links = set()
+
+        for group in zip_longest(*results):
+            for new in group:
+                if new is None or new.link in links:
+                    continue
+
+                links.add(new.link)
+                news.append(new)
+
+        return news
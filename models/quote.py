@@ -1,20 +1,45 @@
 import logging
 from datetime import datetime
-from typing_extensions import Self, Optional, List
+from random import randint
+from typing_extensions import AsyncIterator, Dict, Self, Optional, List, Tuple
 
-from sqlalchemy import  select, update, delete, insert, text
-from sqlalchemy import BigInteger, DateTime, String, Text, Uuid, Index
+from sqlalchemy import  select, update, delete, insert, func, bindparam
+from sqlalchemy import BigInteger, DateTime, Integer, String, Text, Uuid, Index
+from sqlalchemy.dialects.mysql import match
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import BaseTable, sql_engine
+import settings
+from metrics import stats_gauge
+from models import BaseTable, Cache, drop_indexes, sql_engine
+from models.deck import Deck
+from models.lru import LRUCache
 
 LOGGER = logging.getLogger(__name__)
 
+# Quotes quase nunca mudam, então as leituras por (server, id) ficam em memória.
+QUOTE_CACHE = LRUCache(settings.QUOTE_CACHE_SIZE, settings.QUOTE_CACHE_TTL)
+# Resultados das buscas mais recentes, por (server, geração, termos, página).
+SEARCH_CACHE = LRUCache(settings.SEARCH_CACHE_SIZE, settings.SEARCH_CACHE_TTL)
+# Geração da busca de cada servidor; muda quando os quotes mudam.
+SEARCH_GENERATION: Dict[str, int] = {}
+# Menor id, maior id e total de quotes de cada servidor, para o sorteio via SQL.
+BOUNDS_CACHE = LRUCache(settings.QUOTE_CACHE_SIZE, settings.BOUNDS_CACHE_TTL)
+
+stats_gauge('lunabot_quote_cache', 'Quote read-through cache usage.', QUOTE_CACHE.stats)
+stats_gauge('lunabot_search_cache', 'Quote search cache usage.', SEARCH_CACHE.stats)
+
+
+def _invalidate_search(server: str) -> None:
+    SEARCH_GENERATION[str(server)] = SEARCH_GENERATION.get(str(server), 0) + 1
+
 
 class Quotes(BaseTable):
     __tablename__ = 'quotes'
-    __table_args__ = (Index('quote_srv_idx', 'server'), )
+    __table_args__ = (
+        Index('quote_srv_id_idx', 'server', 'id'),
+        Index('quote_msg_ftx', 'message', mysql_prefix='FULLTEXT'),
+    )
 
     id: Mapped[BigInteger] = mapped_column(BigInteger(), primary_key=True, autoincrement=True)
     message: Mapped[Text] = mapped_column(Text(), nullable=False)
@@ -48,22 +73,169 @@ class Quotes(BaseTable):
             LOGGER.error('Can not create quote %s.\n%s' % (self, e))
             raise e
 
+        # O quote já está gravado: falhas daqui em diante só atrasam os caches.
+        _invalidate_search(self.server)
+        bounds = BOUNDS_CACHE.get(str(self.server))
+
+        if bounds:
+            BOUNDS_CACHE.set(str(self.server), (bounds[0], self.id, bounds[2] + 1))
+
+        try:
+            await Deck(self.server).add(self.id)
+        except Exception as e:
+            LOGGER.error('Cannot add quote %s to the deck.\nCause: %s', self.id, e)
+
         LOGGER.info('Created quote %s', self)
 
     async def get(self, id: int, server: str) -> Optional[Self]:
         """
         Retorna um objeto baseado no id.
         """
+        key = (str(server), id)
+        quote = QUOTE_CACHE.get(key)
+
+        if quote is not None:
+            return quote
+
         try:
             async with AsyncSession(sql_engine) as session:
-                stmt = select(Quotes).where(Quotes.id == id).where(Quotes.server == server)
-                cursor = await session.execute(stmt)
+                cursor = await session.execute(GET_STMT, {'id': id, 'server': str(server)})
                 quote = cursor.scalar_one_or_none()
-                return quote
         except Exception as e:
             LOGGER.error(e)
             raise e
 
+        if quote is not None:
+            QUOTE_CACHE.set(key, quote)
+
+        return quote
+
+    async def draw(self, server: str) -> Optional[Self]:
+        """
+        Sorteia um quote do servidor, sem repetir os recentes.
+        O motor do sorteio é escolhido por `settings.RANDOM_QUOTE_ENGINE`.
+        """
+        cache = Cache(server)
+
+        if settings.RANDOM_QUOTE_ENGINE == 'sql':
+            quote = await self.random(server, cache)
+            total = (BOUNDS_CACHE.get(str(server)) or (None, None, 0))[2]
+        else:
+            quote, total = await self._draw_from_deck(server, cache)
+
+        if quote:
+            await cache.insert(quote.id, total)
+
+        return quote
+
+    async def _draw_from_deck(self, server: str, cache: Cache) -> Tuple[Optional[Self], int]:
+        """
+        Tira um quote do baralho do servidor, reabastecendo quando acabar.
+        """
+        deck = Deck(server)
+
+        for _ in range(3):
+            id = await deck.draw()
+
+            if id is None:
+                ids = await self.get_ids_by_server(server)
+
+                if not ids:
+                    return None, 0
+
+                recent = set(await cache.get())
+                await deck.fill([i for i in ids if i not in recent] or ids, len(ids))
+                continue
+
+            # Um quote novo ou o reabastecimento completo podem trazer um recente.
+            if await cache.contains(id):
+                continue
+
+            quote = await self.get(id, server)
+
+            # O quote pode ter sido removido depois de entrar no baralho.
+            if quote:
+                return quote, await deck.total()
+
+        return None, 0
+
+    async def _bounds(self, server: str) -> Optional[Tuple[int, int, int]]:
+        """
+        Menor id, maior id e total de quotes do servidor, guardados em memória.
+        """
+        key = str(server)
+        bounds = BOUNDS_CACHE.get(key)
+
+        if bounds is not None:
+            return bounds
+
+        try:
+            async with AsyncSession(sql_engine) as session:
+                cursor = await session.execute(BOUNDS_STMT, {'server': key})
+                bounds = tuple(cursor.one())
+        except Exception as e:
+            LOGGER.error(e)
+            raise e
+
+        if not bounds[2]:
+            return None
+
+        BOUNDS_CACHE.set(key, bounds)
+        return bounds
+
+    async def random(self, server: str, cache: Optional[Cache] = None) -> Optional[Self]:
+        """
+        Sorteia um quote inteiro numa única consulta.
+
+        Escolhe um id aleatório entre o menor e o maior do servidor e busca o
+        primeiro quote a partir dele pelo índice do servidor. Ids logo depois
+        de buracos na sequência têm mais chance de sair. Com `cache`, cada
+        sorteado é conferido no histórico e os recentes são sorteados de novo.
+        """
+        bounds = await self._bounds(server)
+
+        if not bounds:
+            return None
+
+        quote = None
+        refreshed = False
+
+        for _ in range(3):
+            low, high, _ = bounds
+            pivot = randint(low, high)
+
+            try:
+                async with AsyncSession(sql_engine) as session:
+                    cursor = await session.execute(RANDOM_STMT, {'server': str(server), 'pivot': pivot})
+                    quote = cursor.scalar_one_or_none()
+            except Exception as e:
+                LOGGER.error(e)
+                raise e
+
+            # Sem resultado, o maior id guardado ficou velho (quote removido,
+            # talvez por outro processo): recalcula os limites e tenta de novo.
+            if quote is None:
+                BOUNDS_CACHE.pop(str(server))
+
+                if refreshed:
+                    break
+
+                refreshed = True
+                bounds = await self._bounds(server)
+
+                if not bounds:
+                    return None
+
+                continue
+
+            if cache is None or not await cache.contains(quote.id):
+                break
+
+        if quote:
+            QUOTE_CACHE.set((str(server), quote.id), quote)
+
+        return quote
+
     async def all(self, server: str) -> Optional[List[Self]]:
         """
         Captura todos os quotes.
@@ -74,7 +246,7 @@ class Quotes(BaseTable):
 
         try:
             async with AsyncSession(sql_engine) as session:
-                stmt = select(Quotes).where(server == self.server)
+                stmt = select(Quotes).where(Quotes.server == server)
                 cursor  = await session.execute(stmt)
                 response = cursor.scalars().all()
             return response
@@ -82,7 +254,69 @@ class Quotes(BaseTable):
             LOGGER.error('Can not get all cotes cause: %s', e)
             raise e
 
-    async def get_ids_by_server(self, server: str, not_in: List[int]) -> List[str]:
+    async def page(self, server: str, after: Optional[int] = None, limit: int = settings.PAGE_SIZE) -> List[Self]:
+        """
+        Retorna até `limit` quotes do servidor com id maior que `after`.
+        Paginação por chave, sempre pelo índice (server, id).
+        """
+        try:
+            async with AsyncSession(sql_engine) as session:
+                cursor = await session.execute(PAGE_STMT, {
+                    'server': str(server),
+                    'after': after or 0,
+                    'limit': limit,
+                })
+                return cursor.scalars().all()
+        except Exception as e:
+            LOGGER.error(e)
+            raise e
+
+    async def iterate(self, server: str, batch: int = settings.PAGE_SIZE) -> AsyncIterator[Self]:
+        """
+        Percorre todos os quotes do servidor, uma página por vez.
+        """
+        after = None
+
+        while True:
+            rows = await self.page(server, after, batch)
+
+            for row in rows:
+                yield row
+
+            if len(rows) < batch:
+                return
+
+            after = rows[-1].id
+
+    async def search(self, server: str, terms: str, page: int = 1, limit: int = settings.PAGE_SIZE) -> List[Self]:
+        """
+        Busca quotes do servidor pelo índice FULLTEXT, ordenados por relevância.
+        As buscas repetidas são respondidas da memória.
+        """
+        terms = ' '.join(terms.lower().split())
+        key = (str(server), SEARCH_GENERATION.get(str(server), 0), terms, page, limit)
+        quotes = SEARCH_CACHE.get(key)
+
+        if quotes is not None:
+            return quotes
+
+        try:
+            async with AsyncSession(sql_engine) as session:
+                cursor = await session.execute(SEARCH_STMT, {
+                    'server': str(server),
+                    'terms': terms,
+                    'limit': limit,
+                    'offset': (page - 1) * limit,
+                })
+                quotes = cursor.scalars().all()
+        except Exception as e:
+            LOGGER.error(e)
+            raise e
+
+        SEARCH_CACHE.set(key, quotes)
+        return quotes
+
+    async def get_ids_by_server(self, server: str) -> List[int]:
         """
         Retorna uma lista de IDs baseado no servidor.
         """
@@ -90,22 +324,9 @@ class Quotes(BaseTable):
             LOGGER.warning('Please, insert a server to get quotes IDs.')
             return
 
-        stmt = '''
-            select id
-            from quotes
-            where server = :server
-        '''
-        params = {
-            'server': server
-        }
-
-        if not_in:
-            stmt += ' and id not in :not_in;'
-            params['not_in'] = tuple(not_in)
-
         try:
             async with AsyncSession(sql_engine) as session:
-                cursor = await session.execute(text(stmt), params=params)
+                cursor = await session.execute(IDS_STMT, {'server': str(server)})
                 return cursor.scalars().all()
         except Exception as e:
             LOGGER.error(e)
@@ -124,6 +345,9 @@ class Quotes(BaseTable):
                 await session.commit()
         except Exception as e:
             LOGGER.error(e)
+        finally:
+            QUOTE_CACHE.pop((str(self.server), self.id))
+            _invalidate_search(self.server)
 
     async def delete(self) -> None:
         """
@@ -134,6 +358,11 @@ class Quotes(BaseTable):
                 stmt = delete(Quotes).where(Quotes.id == self.id)
                 await session.execute(stmt)
                 await session.commit()
+
+            QUOTE_CACHE.pop((str(self.server), self.id))
+            BOUNDS_CACHE.pop(str(self.server))
+            _invalidate_search(self.server)
+            await Deck(self.server).discard(self.id)
         except Exception as e:
             LOGGER.error(e)
         else:
@@ -143,3 +372,42 @@ class Quotes(BaseTable):
     async def migrate() -> None:
         async with sql_engine.begin() as session:
             await session.run_sync(Quotes.metadata.create_all)
+
+            # O create_all não cria índices novos em tabelas que já existem.
+            for index in Quotes.__table__.indexes:
+                await session.run_sync(index.create, checkfirst=True)
+
+            # O (server) antigo é prefixo do (server, id) e só pesa nas escritas.
+            await session.run_sync(drop_indexes, Quotes.__table__, ('quote_srv_idx',))
+
+
+# Consultas quentes montadas uma única vez. Os valores vão sempre como
+# parâmetros, então cada uma gera sempre o mesmo SQL e reaproveita o cache
+# de compilação do SQLAlchemy. O servidor é sempre comparado como texto, para
+# o MariaDB usar o índice da coluna `server`.
+_server = bindparam('server', type_=String())
+_limit = bindparam('limit', type_=Integer())
+_relevance = match(Quotes.message, against=bindparam('terms', type_=String())).in_natural_language_mode()
+
+GET_STMT = select(Quotes)\
+    .where(Quotes.id == bindparam('id'))\
+    .where(Quotes.server == _server)
+IDS_STMT = select(Quotes.id).where(Quotes.server == _server)
+BOUNDS_STMT = select(func.min(Quotes.id), func.max(Quotes.id), func.count())\
+    .where(Quotes.server == _server)
+RANDOM_STMT = select(Quotes)\
+    .where(Quotes.server == _server)\
+    .where(Quotes.id >= bindparam('pivot'))\
+    .order_by(Quotes.id)\
+    .limit(1)
+PAGE_STMT = select(Quotes)\
+    .where(Quotes.server == _server)\
+    .where(Quotes.id > bindparam('after'))\
+    .order_by(Quotes.id)\
+    .limit(_limit)
+SEARCH_STMT = select(Quotes)\
+    .where(Quotes.server == _server)\
+    .where(_relevance)\
+    .order_by(_relevance.desc(), Quotes.id)\
+    .limit(_limit)\
+    .offset(bindparam('offset', type_=Integer()))
@@ -1,3 +1,4 @@
+import json
 import os
 from logging import config as logConf
 
@@ -5,15 +6,137 @@ from logging import config as logConf
 BBC_NEWS_URL = os.environ.get('BBC_NEWS_URL', 'https://www.bbc.com/portuguese/topics/cmdm4ynm24kt')
 CNN_NEWS_URL = os.environ.get('CNN_NEWS_URL', 'https://www.cnnbrasil.com.br/internacional/')
 TEC_MUNDO_URL = os.environ.get('TEC_MUNDO_URL', 'https://www.tecmundo.com.br/novidades')
+NEWS_TIMEOUT = float(os.environ.get('NEWS_TIMEOUT', '10'))
+BBC_NEWS_TIMEOUT = float(os.environ.get('BBC_NEWS_TIMEOUT', NEWS_TIMEOUT))
+CNN_NEWS_TIMEOUT = float(os.environ.get('CNN_NEWS_TIMEOUT', NEWS_TIMEOUT))
+TEC_MUNDO_TIMEOUT = float(os.environ.get('TEC_MUNDO_TIMEOUT', NEWS_TIMEOUT))
+NEWS_LIMIT = int(os.environ.get('NEWS_LIMIT', '5'))
+NEWS_REFRESH_INTERVAL = float(os.environ.get('NEWS_REFRESH_INTERVAL', '300'))
+NEWS_TTL = float(os.environ.get('NEWS_TTL', '600'))
+NEWS_MAX_AGE = int(os.environ.get('NEWS_MAX_AGE', '86400'))
+NEWS_DIGEST_BUDGET = float(os.environ.get('NEWS_DIGEST_BUDGET', '5'))
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '10'))
+HTTP_KEEPALIVE = float(os.environ.get('HTTP_KEEPALIVE', '30'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', '0.5'))
+HTTP_USER_AGENT = os.environ.get('HTTP_USER_AGENT', 'Mozilla/5.0 (compatible; LunaLovebot)')
+
+# Fontes de notícias: contêiner (tag, classe) onde está a lista, seletor CSS
+# opcional da lista dentro dele e, para cada campo, (seletor CSS, atributo).
+NEWS_SOURCES = {
+    'bbc': {
+        'url': BBC_NEWS_URL,
+        'timeout': BBC_NEWS_TIMEOUT,
+        'container': ('ul', 'bbc-k6wdzo'),
+        'fields': {
+            'new': ('h2', 'text'),
+            'date': ('time', 'text'),
+            'link': ('a', 'href'),
+            'image': ('div.promo-image img', 'src'),
+        },
+    },
+    'cnn': {
+        'url': CNN_NEWS_URL,
+        'timeout': CNN_NEWS_TIMEOUT,
+        'container': ('div', 'homepage__layout homepage__layout--seventy-thirty'),
+        'list': 'ul.home__new',
+        'fields': {
+            'new': ('h3.news-item-header__title', 'text'),
+            'date': ('span.home__title__date', 'text'),
+            'link': ('a.home__list__tag', 'href'),
+            'image': ('img', 'src'),
+        },
+    },
+    'tecmundo': {
+        'url': TEC_MUNDO_URL,
+        'timeout': TEC_MUNDO_TIMEOUT,
+        'container': ('div', 'tec--list tec--list--lg'),
+        'fields': {
+            'new': ('a.tec--card__title__link', 'text'),
+            'date': ('div.tec--timestamp__item.z--min-w-none', 'text'),
+            'link': ('a.tec--card__title__link', 'href'),
+            'image': ('img.tec--card__thumb__image', 'data-src'),
+        },
+    },
+}
+
+# Fontes extras (ou substituições) num arquivo JSON com o mesmo formato.
+if os.environ.get('NEWS_SOURCES_FILE'):
+    with open(os.environ['NEWS_SOURCES_FILE']) as _file:
+        for _name, _spec in json.load(_file).items():
+            _spec.setdefault('timeout', NEWS_TIMEOUT)
+            NEWS_SOURCES[_name] = _spec
+
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
+COMMAND_PREFIX = os.environ.get('COMMAND_PREFIX', '--')
+# Perfil de intents do gateway: `minimal` (só o necessário) ou `all`.
+INTENTS = os.environ.get('INTENTS', 'minimal').lower()
+# Mensagens guardadas em memória pelo discord.py; 0 desliga o cache.
+MESSAGE_CACHE_SIZE = int(os.environ.get('MESSAGE_CACHE_SIZE', '0'))
+# Sem SHARD_COUNT o Discord decide a quantidade; SHARD_IDS (ex.: "0,1") limita
+# os shards deste processo e exige SHARD_COUNT.
+SHARD_COUNT = int(os.environ['SHARD_COUNT']) if os.environ.get('SHARD_COUNT') else None
+SHARD_IDS = [int(i) for i in os.environ['SHARD_IDS'].split(',')] if os.environ.get('SHARD_IDS') else None
+SHARD_REPORT_INTERVAL = float(os.environ.get('SHARD_REPORT_INTERVAL', '60'))
 __MARIADB_HOST = os.environ.get('MARIADB_HOST', 'localhost')
 __MARIADB_PORT = int(os.environ.get('MARIADB_PORT', '3306'))
 __MARIADB_USER = os.environ.get('MARIADB_USER')
 __MARIADB_PASSWORD = os.environ.get('MARIADB_PASSWORD')
 __MARIADB_DATABASE = os.environ.get('MARIADB_DATABASE', 'lunabot')
 REDIS_URI = os.environ.get('REDIS_URI', 'redis://localhost:6379/0')
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', '20'))
+REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', '5'))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', '5'))
+REDIS_CONNECT_TIMEOUT = float(os.environ.get('REDIS_CONNECT_TIMEOUT', '5'))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', '30'))
+# Escritas de indicadores acumuladas e gravadas a cada N ms ou N eventos.
+WRITE_BEHIND_INTERVAL = int(os.environ.get('WRITE_BEHIND_INTERVAL', '500'))
+WRITE_BEHIND_MAX_EVENTS = int(os.environ.get('WRITE_BEHIND_MAX_EVENTS', '100'))
+CACHE_WINDOW = float(os.environ.get('CACHE_WINDOW', '0.5'))
+# Motor do `--rq`: `deck` (baralho no Redis) ou `sql` (sorteio no MariaDB).
+RANDOM_QUOTE_ENGINE = os.environ.get('RANDOM_QUOTE_ENGINE', 'deck').lower()
+# Limites de id do motor `sql`, por processo. Quotes criados por outro processo
+# (outro shard ou o `import`) só entram no sorteio quando eles expiram.
+BOUNDS_CACHE_TTL = float(os.environ.get('BOUNDS_CACHE_TTL', '60'))
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', '10'))
+QUOTE_CACHE_SIZE = int(os.environ.get('QUOTE_CACHE_SIZE', '2048'))
+QUOTE_CACHE_TTL = float(os.environ.get('QUOTE_CACHE_TTL', '600'))
+DISPATCH_RATE = int(os.environ.get('DISPATCH_RATE', '5'))
+DISPATCH_PER = float(os.environ.get('DISPATCH_PER', '5'))
+DISPATCH_MAX_QUEUE = int(os.environ.get('DISPATCH_MAX_QUEUE', '50'))
+DISPATCH_DRAIN_TIMEOUT = float(os.environ.get('DISPATCH_DRAIN_TIMEOUT', '5'))
+DISPATCH_MAX_BUCKETS = int(os.environ.get('DISPATCH_MAX_BUCKETS', '1024'))
+LUNCH_CACHE_SIZE = int(os.environ.get('LUNCH_CACHE_SIZE', '512'))
+LUNCH_CACHE_TTL = float(os.environ.get('LUNCH_CACHE_TTL', '3600'))
+# A cópia em memória é curta: mudanças feitas por outro processo (import) só
+# invalidam o Redis.
+LUNCH_MEMORY_TTL = float(os.environ.get('LUNCH_MEMORY_TTL', '60'))
+# Quantos sorteios de almoço lembrar e quanto o peso de um local se recupera a cada um.
+LUNCH_HISTORY = int(os.environ.get('LUNCH_HISTORY', '5'))
+LUNCH_DECAY = float(os.environ.get('LUNCH_DECAY', '0.5'))
+LUNCH_MIN_WEIGHT = float(os.environ.get('LUNCH_MIN_WEIGHT', '0.05'))
+LUNCH_PICK_ATTEMPTS = int(os.environ.get('LUNCH_PICK_ATTEMPTS', '20'))
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '512'))
+SEARCH_CACHE_TTL = float(os.environ.get('SEARCH_CACHE_TTL', '120'))
+TRANSFER_BATCH = int(os.environ.get('TRANSFER_BATCH', '1000'))
+# Porta do endpoint `/metrics`; 0 desliga.
+METRICS_HOST = os.environ.get('METRICS_HOST', '0.0.0.0')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))
+LOOP_LAG_INTERVAL = float(os.environ.get('LOOP_LAG_INTERVAL', '0.5'))
+# Fração dos comandos com trace, tempo para logar um comando como lento e o
+# coletor OTLP/HTTP (ex.: http://localhost:4318/v1/traces), opcional.
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '1'))
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', '1000'))
+OTEL_ENDPOINT = os.environ.get('OTEL_ENDPOINT', '')
+OTEL_SERVICE_NAME = os.environ.get('OTEL_SERVICE_NAME', 'lunabot')
 LOGLEVEL = os.environ.get('LOGLEVEL', 'debug').upper()
 
+SQL_POOL_SIZE = int(os.environ.get('SQL_POOL_SIZE', '5'))
+SQL_MAX_OVERFLOW = int(os.environ.get('SQL_MAX_OVERFLOW', '10'))
+SQL_POOL_TIMEOUT = float(os.environ.get('SQL_POOL_TIMEOUT', '30'))
+SQL_POOL_RECYCLE = int(os.environ.get('SQL_POOL_RECYCLE', '600'))
+SQL_ECHO_POOL = os.environ.get('SQL_ECHO_POOL', 'false').lower() in ('1', 'true', 'yes')
+
 MARIADB_URI = f'mysql+asyncmy://{__MARIADB_USER}:{__MARIADB_PASSWORD}@'\
     f'{__MARIADB_HOST}:{__MARIADB_PORT}/{__MARIADB_DATABASE}'
 
@@ -0,0 +1,53 @@
+import asyncio
+
+from core.dispatch import Dispatcher
+
+
+class Channel:
+    def __init__(self, id: int) -> None:
+        self.id = id
+
+
+class FakeContext:
+    def __init__(self, channel: int, sent: list) -> None:
+        self.channel = Channel(channel)
+        self.sent = sent
+
+    async def send(self, content: str = '', **kwargs) -> None:
+        self.sent.append((content, kwargs))
+
+
+def test_burst_of_text_is_merged_instead_of_dropped() -> None:
+    sent = []
+
+    async def scenario() -> Dispatcher:
+        dispatcher = Dispatcher(rate=5, per=5, max_queue=5, max_buckets=10)
+
+        for i in range(12):
+            await dispatcher.send(FakeContext(1, sent), f'quote {i}')
+
+        await dispatcher.close(timeout=1)
+        return dispatcher
+
+    dispatcher = asyncio.run(scenario())
+
+    assert dispatcher.dropped == 0
+    assert '\n'.join(content for content, _ in sent) == '\n'.join(f'quote {i}' for i in range(12))
+
+
+def test_full_queue_drops_oldest_when_nothing_merges() -> None:
+    sent = []
+
+    async def scenario() -> Dispatcher:
+        dispatcher = Dispatcher(rate=100, per=1, max_queue=2, max_buckets=10)
+
+        for i in range(4):
+            await dispatcher.send(FakeContext(1, sent), embed=i)
+
+        await dispatcher.close(timeout=1)
+        return dispatcher
+
+    dispatcher = asyncio.run(scenario())
+
+    assert dispatcher.dropped == 2
+    assert [kwargs['embed'] for _, kwargs in sent] == [2, 3]
@@ -0,0 +1,114 @@
+import asyncio
+from random import randint
+
+from sqlalchemy.dialects import mysql
+
+import settings
+import models.lunch_place
+import models.quote
+from models import RedisOrm
+from models.lunch_place import LunchPlace
+from models.quote import Quotes
+
+
+DIALECT = mysql.dialect()
+
+
+class FakeResult:
+    """
+    Resultado mínimo para os métodos dos modelos seguirem em frente.
+    """
+    def scalar_one_or_none(self) -> Quotes:
+        return Quotes(id=randint(1, 1000), message='quote', server='1', created_by='alice')
+
+    def one(self) -> tuple:
+        return 1, 1000, 1000
+
+    def scalars(self) -> list:
+        return FakeScalars()
+
+
+class FakeScalars(list):
+    def all(self) -> list:
+        return []
+
+
+class FakeSession:
+    """
+    Sessão que só registra o SQL de cada consulta, como o MariaDB o receberia.
+    """
+    def __init__(self, executed: set) -> None:
+        self.executed = executed
+
+    async def __aenter__(self) -> 'FakeSession':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    async def execute(self, stmt, params=None) -> FakeResult:
+        self.executed.add(str(stmt.compile(dialect=DIALECT)))
+        return FakeResult()
+
+
+class FakePipeline:
+    async def __aenter__(self) -> 'FakePipeline':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: None
+
+    async def execute(self, raise_on_error: bool = True) -> list:
+        return []
+
+
+class FakeRedis:
+    async def hgetall(self, key: str) -> dict:
+        return {}
+
+    async def zscore(self, key: str, member) -> None:
+        return None
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline()
+
+
+async def exercise(i: int) -> None:
+    """
+    Uma rodada dos comandos quentes, com argumentos diferentes a cada `i`.
+    """
+    server = str(randint(1, 10 ** 18))
+
+    await Quotes().get(randint(1, 10 ** 9), server)
+    await Quotes().draw(server)
+    await Quotes().page(server, after=i)
+    await Quotes().page(server)
+    await Quotes().search(server, f'termo {i}', page=randint(1, 10))
+    await LunchPlace().get_ids_by_server(server)
+    await LunchPlace().page(server, after=i)
+    await LunchPlace().candidates(server)
+
+
+def test_distinct_sql_stays_constant_under_load(monkeypatch) -> None:
+    executed = set()
+    monkeypatch.setattr(models.quote, 'AsyncSession', lambda engine: FakeSession(executed))
+    monkeypatch.setattr(models.lunch_place, 'AsyncSession', lambda engine: FakeSession(executed))
+    monkeypatch.setattr(RedisOrm, 'client', FakeRedis())
+    monkeypatch.setattr(settings, 'RANDOM_QUOTE_ENGINE', 'sql')
+
+    async def scenario() -> int:
+        await exercise(0)
+        warm = len(executed)
+
+        for i in range(1, 200):
+            await exercise(i)
+
+        return warm
+
+    warm = asyncio.run(scenario())
+
+    assert warm > 0
+    assert len(executed) == warm
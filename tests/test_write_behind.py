@@ -0,0 +1,67 @@
+import asyncio
+
+from models import RedisOrm, WriteBehind
+
+
+class SlowPipeline:
+    """
+    Pipeline falso cujo `execute` demora, para o `close` cair no meio do flush.
+    """
+    def __init__(self, store: dict) -> None:
+        self.store = store
+        self.commands = []
+
+    async def __aenter__(self) -> 'SlowPipeline':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    def hincrby(self, key: str, field: str, amount: int) -> None:
+        self.commands.append(('hincrby', key, field, amount))
+
+    def zincrby(self, key: str, amount: int, member: str) -> None:
+        self.commands.append(('zincrby', key, member, amount))
+
+    def set(self, key: str, value) -> None:
+        self.commands.append(('set', key, None, value))
+
+    async def execute(self, raise_on_error: bool = True) -> list:
+        await asyncio.sleep(0.2)
+
+        for op, key, field, value in self.commands:
+            if op == 'set':
+                self.store[key] = value
+            else:
+                self.store[(key, field)] = self.store.get((key, field), 0) + value
+
+        return [True] * len(self.commands)
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.store = {}
+
+    def pipeline(self, transaction: bool = True) -> SlowPipeline:
+        return SlowPipeline(self.store)
+
+
+def test_close_during_flush_keeps_writes(monkeypatch) -> None:
+    redis = FakeRedis()
+    monkeypatch.setattr(RedisOrm, 'client', redis)
+
+    async def scenario() -> None:
+        buffer = WriteBehind(interval=60, max_events=2)
+        buffer.start()
+        buffer.hincrby('q:1', 'alice')
+        buffer.set('1', 42)
+
+        # O segundo evento acorda o ciclo; espera o flush começar.
+        await asyncio.sleep(0.05)
+        assert buffer.pending('1') == 42
+
+        await buffer.close()
+
+    asyncio.run(scenario())
+
+    assert redis.store == {('q:1', 'alice'): 1, '1': 42}